@@ -0,0 +1,196 @@
+"""Microbenchmark of compiled predicates against the per-call search they replaced.
+
+Every events and registry criterion of the shipped indicators is checked against a set
+of events three ways:
+
+- interpreted: parse the search string, split the key and walk the item on every call,
+  the way searcher worked before predicates were compiled
+- searcher: the compatibility wrapper, which looks its predicate up in the compile cache
+- predicate: Predicate.search on a Record view shared by every criterion
+
+The verdicts of all three must agree, and the time per call of each is printed, so the
+speedup can be reproduced and checked for regressions.
+
+Usage, from the repository root:
+    python benchmarks/predicates.py [--number N] [evtx files...]
+
+Without evtx files it runs on a few built in events shaped like the decoder's.
+"""
+
+# Standard Python Libraries
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import timeit
+from typing import Any, List, Tuple
+
+_PARSER = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+_PARSER.add_argument("evtx", nargs="*", help="evtx files to read events from.")
+_PARSER.add_argument(
+    "--number", type=int, default=20, help="Passes over every check, per path."
+)
+_ARGS = _PARSER.parse_args()
+# The repository root, so chirp can be imported without being installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# cisagov Libraries
+from chirp import load  # noqa: E402
+from chirp.plugins import operators  # noqa: E402
+
+_SKIPPED = ("event_type", "event_id", "registry_key", "condition")
+_EVENTS = [
+    {
+        "event": {
+            "system": {
+                "provider": {"name": "Microsoft-Windows-PowerShell"},
+                "event_id": 4104,
+                "computer": "HOST-A",
+                "time_created": {"system_time": "2021-01-05 13:30:00.000000"},
+            },
+            "event_data": {
+                "message_number": 1,
+                "message_total": 1,
+                "script_block_text": "Get-ChildItem Cert:\\LocalMachine\\My | Export-PfxCertificate -FilePath c:\\t.pfx",
+                "path": "",
+            },
+            "fields": {"source": "Microsoft-Windows-PowerShell%4Operational.evtx"},
+        }
+    },
+    {
+        "event": {
+            "system": {
+                "provider": {"name": "Microsoft-Windows-Security-Auditing"},
+                "event_id": 4688,
+                "computer": "HOST-B",
+                "time_created": {"system_time": "2021-01-05 13:31:00.000000"},
+            },
+            "event_data": {
+                "new_process_name": "C:\\Windows\\System32\\certutil.exe",
+                "command_line": "certutil -exportPFX my 01 c:\\t.pfx",
+                "subject_user_name": "admin",
+                "token_elevation_type": "%%1936",
+            },
+            "fields": {"source": "Security.evtx"},
+        }
+    },
+    {
+        "event": {
+            "system": {
+                "provider": {"name": "Microsoft-Windows-Security-Auditing"},
+                "event_id": 4624,
+                "computer": "HOST-B",
+                "time_created": {"system_time": "2021-01-05 13:32:00.000000"},
+            },
+            "event_data": {
+                "logon_type": 3,
+                "target_user_name": "svc_backup",
+                "ip_address": "10.0.0.12",
+                "workstation_name": "HOST-C",
+            },
+            "fields": {"source": "Security.evtx"},
+        }
+    },
+]
+
+
+def _interpreted(check_value: Any, item: Any, key: Any = None) -> Any:
+    """Search an item the way searcher did before predicates, reparsing everything on each call."""
+    parsed = operators.parse_operator_and_operand(check_value)
+    if not parsed or parsed[0] is None:
+        return None
+    operator, operand = parsed
+    if operator is not operators.regular_expression:
+        operand = operators.compile_operand(operator, operand)
+    if key and "." in key:
+        item = operators.navigate_structure(item, key.split("."))
+        return _interpreted(check_value, item, None)
+    if isinstance(item, dict):
+        return any(_interpreted(check_value, v, key) for v in item.values())
+    return operator(operand, item)
+
+
+def criteria() -> List[Tuple[str, str]]:
+    """Return the (key, search string) of every events and registry criterion shipped."""
+    paths = glob.glob(os.path.join("indicators", "*", "*.y*ml"))
+    found = set()
+    for indicator in load._parse(paths):
+        if indicator["ioc_type"] not in ("events", "registry"):
+            continue
+        for key, value in indicator["indicator"].items():
+            if key not in _SKIPPED and isinstance(value, str):
+                found.add((str(key).lower(), value))
+    return sorted(found)
+
+
+def events() -> List[dict]:
+    """Return the events to check, read from the given evtx files or the built in ones."""
+    if not _ARGS.evtx:
+        return _EVENTS
+    # cisagov Libraries
+    from chirp.plugins.events.decoder import iter_events
+
+    return [event for path in _ARGS.evtx for event in iter_events(path)]
+
+
+def main() -> int:
+    """Run the benchmark, returning 1 if the paths disagree on any verdict."""
+    logging.disable(logging.CRITICAL)
+    checks = criteria()
+    items = events()
+    predicates = [operators.compile_predicate(v, k) for k, v in checks]
+    pairs = [(k, v, p) for (k, v), p in zip(checks, predicates) if p is not None]
+    if len(pairs) < len(checks):
+        print(
+            "Skipping {} criteria that do not compile".format(len(checks) - len(pairs))
+        )
+
+    disagree = 0
+    for item in items:
+        record = operators.Record(item)
+        for key, value, predicate in pairs:
+            verdicts = {
+                bool(_interpreted(value, item, key)),
+                bool(operators.searcher(value, item, key)),
+                predicate.search(record),
+            }
+            if len(verdicts) > 1:
+                disagree += 1
+                print("Disagree: {} {}".format(key, json.dumps(value)))
+
+    def interpreted() -> None:
+        for item in items:
+            for key, value, _ in pairs:
+                _interpreted(value, item, key)
+
+    def searcher() -> None:
+        for item in items:
+            for key, value, _ in pairs:
+                operators.searcher(value, item, key)
+
+    def predicate() -> None:
+        for item in items:
+            record = operators.Record(item)
+            for _, _, p in pairs:
+                p.search(record)
+
+    calls = len(items) * len(pairs) * _ARGS.number
+    print(
+        "{} criteria, {} events, {} checks per path".format(
+            len(pairs), len(items), calls
+        )
+    )
+    for name, run in (
+        ("interpreted", interpreted),
+        ("searcher", searcher),
+        ("predicate", predicate),
+    ):
+        seconds = min(timeit.repeat(run, number=_ARGS.number, repeat=3))
+        print("{:<12} {:8.2f} us/call".format(name, seconds / calls * 1e6))
+    return 1 if disagree else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
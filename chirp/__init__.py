@@ -1 +1,3 @@
 """CHIRP Initializer."""
+
+__version__ = "1.0"
@@ -2,24 +2,58 @@
 
 # Standard Python Libraries
 import argparse
-import ctypes
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 import glob
 import json
 import logging
 import os
+import re
 import sys
 import typing as t
 
-# Third-Party Libraries
-from rich.console import Console
-from rich.logging import RichHandler
-from rich.theme import Theme
+_DURATION_UNITS = {"d": "days", "h": "hours", "m": "minutes"}
+_DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+def _point_in_time(value: str) -> datetime:
+    """Parse a --since/--until value into an aware UTC datetime.
+
+    :param value: A duration back from now (Ex: 7d, 12h, 30m) or a UTC date (Ex: 2021-01-05, 2021-01-05T13:30:00)
+    :type value: str
+    :raises argparse.ArgumentTypeError: If the value is neither
+    :return: The point in time
+    :rtype: datetime
+    """
+    duration = re.fullmatch(r"(\d+)([dhm])", value.strip())
+    if duration:
+        ago = timedelta(**{_DURATION_UNITS[duration.group(2)]: int(duration.group(1))})
+        return datetime.now(timezone.utc) - ago
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).replace(
+                tzinfo=timezone.utc
+            )
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(
+        "'{}' is neither a duration like 7d, 12h or 30m nor a date like 2021-01-05T13:30:00.".format(
+            value
+        )
+    )
+
 
 parser = argparse.ArgumentParser(
     prog="CHIRP",
     description="CHIRP. A Window host forensic artifact collection tool.",
 )
-parser.add_argument("-a", "--activity", help="Specified AA threat package to run.")
+parser.add_argument(
+    "-a",
+    "--activity",
+    nargs="*",
+    help="Specified AA threat packages to run, or all. Their indicators are checked in one pass.",
+    default=None,
+)
 parser.add_argument(
     "-o", "--output", help="Specified output directory.", default="output"
 )
@@ -33,6 +67,77 @@ parser.add_argument(
     help="Specified override filepath targets for yara plugin indicators.",
     default=None,
 )
+parser.add_argument(
+    "-e",
+    "--evtx-dir",
+    help="Specified directory tree of collected .evtx files to scan instead of the live event logs.",
+    default=None,
+)
+parser.add_argument(
+    "--carve",
+    help="Carve records out of damaged event logs or raw images by their signatures, instead of walking them.",
+    action="store_true",
+)
+parser.add_argument(
+    "--since",
+    type=_point_in_time,
+    help="Only scan events logged after this point, as a duration back from now (7d, 12h, 30m) or a UTC date.",
+    default=None,
+)
+parser.add_argument(
+    "--until",
+    type=_point_in_time,
+    help="Only scan events logged before this point, as a duration back from now (7d, 12h, 30m) or a UTC date.",
+    default=None,
+)
+parser.add_argument(
+    "--max-matches",
+    type=int,
+    help="Specified number of sample events to keep for each events indicator, 0 keeps every match.",
+    default=100,
+)
+parser.add_argument(
+    "--shared-events",
+    help="Write each matching event once in events.json, with indicators listing the positions of theirs.",
+    action="store_true",
+)
+parser.add_argument(
+    "--verdict-cache",
+    type=int,
+    help="Specified number of regular expression verdicts on event values to cache, 0 disables the cache.",
+    default=65536,
+)
+parser.add_argument(
+    "--profile",
+    help="Time each events regular expression and report the ones that took the longest.",
+    action="store_true",
+)
+parser.add_argument(
+    "--regex-budget",
+    type=float,
+    help="Specified seconds each events regular expression may spend searching in a worker before it is reported as slow.",
+    default=None,
+)
+parser.add_argument(
+    "--checkpoint",
+    help="Specified file to keep event log checkpoints in, so that later runs only read new records.",
+    default=None,
+)
+parser.add_argument(
+    "--event-store",
+    help="Specified directory to keep an indexed store of the parsed events in, for later runs to hunt through with --from-store.",
+    default=None,
+)
+parser.add_argument(
+    "--from-store",
+    help="Evaluate events indicators against the --event-store instead of reading event logs.",
+    action="store_true",
+)
+parser.add_argument(
+    "--bundle-cache",
+    help='Specified directory to cache parsed and compiled indicators in, keyed by their contents. "" disables the cache.',
+    default=os.path.join("indicators", ".bundles"),
+)
 parser.add_argument(
     "--non-interactive",
     help="Run in non-interactive mode (close after completion).",
@@ -50,46 +155,67 @@ parser.add_argument(
     default=0,
     help="program verbosity, use more `v`s to increase verbosity, default is no verbosity.",
 )
-ARGS, _ = parser.parse_known_args()
-OUTPUT_DIR = ARGS.output
-PLUGINS = ARGS.plugins
-TARGETS = ARGS.targets
-ACTIVITY = ARGS.activity
-NON_INTERACTIVE = ARGS.non_interactive
-
-if ARGS.verbose >= 2:
-    LOG_LEVEL = logging.NOTSET
-elif ARGS.verbose == 1:
-    LOG_LEVEL = logging.INFO
-elif NON_INTERACTIVE:
-    LOG_LEVEL = 70
-else:
-    LOG_LEVEL = logging.ERROR
-
-if ARGS.silent:
-    LOG_LEVEL = 100
-
-_CONSOLE = Console(
-    record=True,
-    theme=Theme(
-        {
-            "logging.level.registry": "bright_green",
-            "logging.level.events": "bright_blue",
-            "logging.level.yara": "bright_yellow",
-            "logging.level.network": "bright_white",
-            "logging.level.complete": "bright_cyan",
-        }
-    ),
-)
-
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format="%(message)s",
-    datefmt="%X",
-    handlers=[
-        RichHandler(rich_tracebacks=True, tracebacks_show_locals=True, console=_CONSOLE)
-    ],
-)
+# The command line is parsed the first time an option is read rather than on import, so that
+# importing CHIRP from another tool never reads that tool's arguments. Each option is read
+# as a module constant, by the name it maps to here.
+_OPTIONS = {
+    "OUTPUT_DIR": "output",
+    "PLUGINS": "plugins",
+    "TARGETS": "targets",
+    "ACTIVITY": "activity",
+    "EVTX_DIR": "evtx_dir",
+    "CARVE": "carve",
+    "SINCE": "since",
+    "UNTIL": "until",
+    "CHECKPOINT": "checkpoint",
+    "MAX_MATCHES": "max_matches",
+    "SHARED_EVENTS": "shared_events",
+    "VERDICT_CACHE": "verdict_cache",
+    "PROFILE": "profile",
+    "REGEX_BUDGET": "regex_budget",
+    "EVENT_STORE": "event_store",
+    "FROM_STORE": "from_store",
+    "BUNDLE_CACHE": "bundle_cache",
+    "NON_INTERACTIVE": "non_interactive",
+}
+
+
+@lru_cache(maxsize=None)
+def args() -> argparse.Namespace:
+    """Parse the command line, the first time it is called in a process.
+
+    :return: The parsed arguments, leaving out any CHIRP does not know.
+    :rtype: argparse.Namespace
+    """
+    return parser.parse_known_args()[0]
+
+
+def _log_level() -> int:
+    """Return the level to log at, from the verbosity arguments."""
+    if args().silent:
+        return 100
+    if args().verbose >= 2:
+        return logging.NOTSET
+    if args().verbose == 1:
+        return logging.INFO
+    if args().non_interactive:
+        return 70
+    return logging.ERROR
+
+
+def __getattr__(name: str) -> t.Any:
+    """Read ARGS, LOG_LEVEL and the option constants, parsing the command line on first use."""
+    if name == "ARGS":
+        return args()
+    if name == "LOG_LEVEL":
+        return _log_level()
+    if name in _OPTIONS:
+        return getattr(args(), _OPTIONS[name])
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+# The recording console logs are written to, created by setup_logging
+_CONSOLE = None
 
 EVENTS = 60
 REGISTRY = 61
@@ -104,16 +230,58 @@ logging.addLevelName(NETWORK, "NETWORK")
 logging.addLevelName(COMPLETE, "COMPLETE")
 
 
-def _is_admin():
-    """Return True if program is ran from admin terminal.
+def setup_logging() -> None:
+    """Send logging to a recording Rich console, the first time it is called in a process.
+
+    Nothing is set up on import, so that importing CHIRP, and starting each pool worker, stays fast.
+    """
+    global _CONSOLE
+    if _CONSOLE is not None:
+        return
+    # Third-Party Libraries
+    from rich.console import Console
+    from rich.logging import RichHandler
+    from rich.theme import Theme
+
+    _CONSOLE = Console(
+        record=True,
+        theme=Theme(
+            {
+                "logging.level.registry": "bright_green",
+                "logging.level.events": "bright_blue",
+                "logging.level.yara": "bright_yellow",
+                "logging.level.network": "bright_white",
+                "logging.level.complete": "bright_cyan",
+            }
+        ),
+    )
+
+    logging.basicConfig(
+        level=_log_level(),
+        format="%(message)s",
+        datefmt="%X",
+        handlers=[
+            RichHandler(
+                rich_tracebacks=True, tracebacks_show_locals=True, console=_CONSOLE
+            )
+        ],
+    )
+
+
+@lru_cache(maxsize=None)
+def is_admin() -> bool:
+    """Return True if program is ran from admin terminal, checked the first time a plugin needs it.
 
     Reference: `Racoon.ninja <https://raccoon.ninja/en/dev/using-python-to-check-if-the-application-is-running-as-an-administrator/>`_
     """
     try:
-        is_admin = os.getuid() == 0
+        admin = os.getuid() == 0
     except AttributeError:
-        is_admin = ctypes.windll.shell32.IsUserAnAdmin() != 0
-    return is_admin
+        # Standard Python Libraries
+        import ctypes
+
+        admin = ctypes.windll.shell32.IsUserAnAdmin() != 0
+    return admin
 
 
 def _get_platform():
@@ -131,7 +299,6 @@ def _get_platform():
 # https://github.com/python/typing/issues/182
 JSON = t.Union[str, int, float, bool, None, t.Mapping[str, "JSON"], t.List["JSON"]]
 
-ADMIN = _is_admin()
 OS = _get_platform()
 
 
@@ -144,13 +311,16 @@ def build_report(indicator: dict) -> dict:
     :rtype: dict
     """
     report = {attr: indicator[attr] for attr in ["description", "confidence"]}
+    if "activities" in indicator:
+        report["activities"] = indicator["activities"]
     report["matches"] = []
     return report
 
 
 def save_log() -> None:
     """Save the log output to `chirp.log`."""
-    _CONSOLE.save_text("chirp.log")
+    if _CONSOLE is not None:
+        _CONSOLE.save_text("chirp.log")
 
 
 def wait() -> None:
@@ -159,7 +329,7 @@ def wait() -> None:
 
     Reference: `CrouZ, StackOverflow <https://stackoverflow.com/a/16933120>`_
     """
-    if not ARGS.non_interactive:
+    if not args().non_interactive:
         if OS == "Windows":
             os.system("pause")  # nosec
         else:
@@ -169,7 +339,7 @@ def wait() -> None:
 
 def iocs_discovered() -> bool:
     """Determine whether iocs were discovered."""
-    report_files = glob.glob("{}/*".format(OUTPUT_DIR))
+    report_files = glob.glob("{}/*".format(args().output))
     for report_file in report_files:
         with open(report_file, "r") as f:
             data = json.load(f)
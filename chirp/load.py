@@ -1,25 +1,210 @@
-"""Provides methods for loading indicator files."""
+"""Provides methods for loading indicator files.
+
+Parsing YAML is the slowest part of starting a run, so what a run loads and compiles
+from a set of indicator files is kept in a bundle under the --bundle-cache directory,
+keyed by a hash of the files' contents. A later run over the same, unchanged files
+loads the bundle instead of parsing them, along with the yara rules compiled from them.
+
+A bundle is JSON, holding only the indicators and the saved rules, so reading one never
+runs code. Predicates are cheap to compile and are built again on every run. Bundles
+are only read from a directory and file the current user owns and no one else can
+write to.
+"""
 
 # Standard Python Libraries
+import base64
+import hashlib
+import json
 import logging
-from typing import Iterator, List
+import os
+import stat
+import sys
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Union
+
+# cisagov Libraries
+from chirp import __version__, common
+
+# Changed whenever what a bundle holds changes, so older bundles are not read
+_BUNDLE_VERSION = 3
+# The bundle of this run: its path, and what has been compiled from its indicators
+_BUNDLE: Dict[str, Any] = {"path": None, "indicators": [], "artifacts": {}}
+
+
+def digest(file_paths: Iterable[str]) -> str:
+    """Return a hash of the contents of a set of indicator files.
+
+    :param file_paths: Paths to the indicator files.
+    :type file_paths: Iterable[str]
+    :return: A hex digest, which also changes with the Python, CHIRP, yara and bundle versions.
+    :rtype: str
+    """
+    try:
+        # Third-Party Libraries
+        import yara
 
-# Third-Party Libraries
-import yaml
+        yara_version = yara.__version__
+    except ImportError:
+        yara_version = None
+    sha = hashlib.sha256(
+        "{}.{}:{}:{}:{}".format(
+            *sys.version_info[:2], __version__, yara_version, _BUNDLE_VERSION
+        ).encode("utf-8")
+    )
+    for path in sorted(file_paths, key=os.path.basename):
+        sha.update(os.path.basename(path).encode("utf-8") + b"\x00")
+        with open(path, "rb") as f:
+            sha.update(hashlib.sha256(f.read()).digest())
+    return sha.hexdigest()
 
 
-def from_yaml(file_paths: List[str]) -> Iterator[dict]:
+def _bundle_path(file_paths: List[str]) -> str:
+    """Return the path of the bundle for the current contents of a set of indicator files."""
+    # Bundles of one set of files share a prefix, so a stale one can be found and removed
+    files = hashlib.sha256(
+        "\x00".join(sorted(os.path.abspath(p) for p in file_paths)).encode("utf-8")
+    ).hexdigest()
+    return os.path.join(
+        common.BUNDLE_CACHE, "{}-{}.bundle".format(files[:12], digest(file_paths)[:32])
+    )
+
+
+def _parse(file_paths: List[str]) -> Iterator[dict]:
+    """Parse indicator files, yielding each indicator that has the fields every plugin needs."""
+    # Third-Party Libraries
+    import yaml  # Only needed when there is no bundle to load instead
+
+    # The C accelerated loader, if PyYAML was built with libyaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    for indicator in file_paths:
+        try:
+            with open(indicator, encoding="utf8") as f:
+                documents = list(yaml.load_all(f.read(), Loader=loader))
+        except (TypeError, UnicodeDecodeError, yaml.YAMLError):
+            logging.critical("Had an issue parsing {}".format(indicator))
+            continue
+        for document in documents:
+            if document is None:
+                continue  # An empty document, such as after a trailing ---
+            if not isinstance(document, dict) or not all(
+                k in document for k in ("name", "ioc_type", "indicator")
+            ):
+                logging.error(
+                    "Skipping an indicator in {} without a name, ioc_type and indicator.".format(
+                        indicator
+                    )
+                )
+                continue
+            # The activity is the package directory the indicator file sits in
+            document.setdefault(
+                "activities", [os.path.basename(os.path.dirname(indicator))]
+            )
+            yield document
+
+
+def _trusted(path: str) -> bool:
+    """Return whether a bundle and its directory are owned by the current user and writable by no one else."""
+    if not hasattr(os, "getuid"):
+        return True  # Windows, where files are guarded by ACLs rather than owners and modes
+    for checked in (os.path.dirname(path), path):
+        info = os.stat(checked)
+        if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            logging.warning(
+                "Not reading the indicator bundle {}, as {} could be changed by another user.".format(
+                    path, checked
+                )
+            )
+            return False
+    return True
+
+
+def _read_bundle(path: str) -> Union[Dict[str, Any], None]:
+    """Read a bundle, or return None if there is no usable one."""
+    try:
+        if not _trusted(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            bundle = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:  # A damaged or outdated bundle is rebuilt
+        logging.debug("Could not read the indicator bundle {}: {}".format(path, e))
+        return None
+    if not isinstance(bundle, dict) or bundle.get("version") != _BUNDLE_VERSION:
+        return None
+    return bundle
+
+
+def _write_bundle() -> None:
+    """Write this run's bundle, replacing any bundle of an earlier version of its files."""
+    path = _BUNDLE["path"]
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        with open(path + ".partial", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": _BUNDLE_VERSION,
+                    "indicators": _BUNDLE["indicators"],
+                    "artifacts": _BUNDLE["artifacts"],
+                },
+                f,
+            )
+        os.replace(path + ".partial", path)
+        prefix = os.path.basename(path).split("-")[0] + "-"
+        for name in os.listdir(os.path.dirname(path)):
+            if name.startswith(prefix) and name != os.path.basename(path):
+                os.remove(os.path.join(os.path.dirname(path), name))
+    except (OSError, TypeError, ValueError) as e:
+        # Without a bundle the next run parses the indicators again, which is all it costs
+        logging.debug("Could not write the indicator bundle {}: {}".format(path, e))
+
+
+def from_yaml(file_paths: Iterable[str]) -> Iterator[dict]:
     """Given a list of yaml files, parses files and returns as a dict.
 
     :param file_paths: A list of file paths.
-    :type file_paths: List[str]
+    :type file_paths: Iterable[str]
     :yield: A dict representation of a yaml file.
     :rtype: Iterator[dict]
     """
     logging.debug("Started indicator loader.")
-    for indicator in file_paths:
-        try:
-            yield from yaml.safe_load_all(open(indicator, encoding="utf8").read())
-        except (TypeError, UnicodeDecodeError):
-            logging.critical("Had an issue parsing {}".format(indicator))
+    file_paths = list(file_paths)
+    bundle = None
+    if common.BUNDLE_CACHE and file_paths:
+        _BUNDLE["path"] = _bundle_path(file_paths)
+        bundle = _read_bundle(_BUNDLE["path"])
+    if bundle:
+        logging.debug("Loaded indicators from {}.".format(_BUNDLE["path"]))
+        _BUNDLE.update(indicators=bundle["indicators"], artifacts=bundle["artifacts"])
+    else:
+        _BUNDLE.update(indicators=list(_parse(file_paths)), artifacts={})
+        _write_bundle()
+    yield from _BUNDLE["indicators"]
     logging.debug("Finished loading indicators.")
+
+
+def compiled(
+    name: str, build: Callable[..., bytes], *args: Any, rebuild: bool = False
+) -> bytes:
+    """Return what a plugin compiles from its indicators, from the bundle if an earlier run compiled it.
+
+    :param name: A name for what is compiled, unique to the plugin.
+    :type name: str
+    :param build: Compiles it from args, returning it saved as bytes.
+    :type build: Callable[..., bytes]
+    :param rebuild: Build it again, replacing what the bundle holds, such as after it failed to load., defaults to False
+    :type rebuild: bool, optional
+    :return: What build returned for the same args.
+    :rtype: bytes
+    """
+    key = "{}:{}".format(
+        name,
+        hashlib.sha256(json.dumps(args, default=str).encode("utf-8")).hexdigest(),
+    )
+    if not rebuild and key in _BUNDLE["artifacts"]:
+        return base64.b64decode(_BUNDLE["artifacts"][key])
+    result = build(*args)
+    _BUNDLE["artifacts"][key] = base64.b64encode(result).decode("ascii")
+    _write_bundle()
+    return result
@@ -1,7 +1,25 @@
 """Event plugin initializer."""
 
-from . import scan
+# Standard Python Libraries
+from typing import Any
 
-REQUIRED_OS = "Windows"
-REQUIRED_ADMIN = True
-entrypoint = scan.run
+# cisagov Libraries
+from chirp import common
+
+
+def __getattr__(name: str) -> Any:
+    """Return REQUIRED_OS and REQUIRED_ADMIN, which depend on the arguments of the run."""
+    offline = common.EVTX_DIR or common.FROM_STORE
+    if name == "REQUIRED_OS":
+        # Scanning a collected corpus or the event store only reads files, so it can run anywhere.
+        return ("Windows", "Linux", "MacOS") if offline else "Windows"
+    if name == "REQUIRED_ADMIN":
+        return not offline
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def entrypoint(indicators: list):
+    """Run the events plugin, importing it only once there are indicators for it to run."""
+    from . import scan
+
+    return scan.run(indicators)
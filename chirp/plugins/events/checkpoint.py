@@ -0,0 +1,123 @@
+"""Keeps a checkpoint per event log, so that repeated runs only read the records logged since."""
+
+# Standard Python Libraries
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Union
+
+# cisagov Libraries
+from chirp.common import CHECKPOINT, EVENTS
+
+HAS_LIBS = False
+try:
+    # cisagov Libraries
+    from chirp.plugins.events.decoder import find_record, record_range
+
+    HAS_LIBS = True
+except ImportError:
+    pass  # events.py reports the missing dependency
+
+
+def load(path: str = CHECKPOINT) -> Dict[str, Dict[str, Any]]:
+    """Load saved checkpoints, keyed by the absolute path of each log.
+
+    :param path: The checkpoint file, defaults to the --checkpoint argument.
+    :type path: str, optional
+    :return: The checkpoints, empty if there are none yet or they can't be read.
+    :rtype: Dict[str, Dict[str, Any]]
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logging.error(
+            "Could not read checkpoints from {}, scanning in full.".format(path)
+        )
+        return {}
+
+
+def save(checkpoints: Dict[str, Dict[str, Any]], path: str = CHECKPOINT) -> None:
+    """Write checkpoints out, replacing the old file only once the new one is complete.
+
+    :param checkpoints: The checkpoints, keyed by the absolute path of each log.
+    :type checkpoints: Dict[str, Dict[str, Any]]
+    :param path: The checkpoint file, defaults to the --checkpoint argument.
+    :type path: str, optional
+    """
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoints, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def digest(index: Dict[Union[str, None], list]) -> str:
+    """Return a hash of the indicators that read a log, so a checkpoint is dropped when they change.
+
+    :param index: The indicators for one log, as built by scan.index_indicators.
+    :type index: Dict[Union[str, None], list]
+    :return: A hex digest.
+    :rtype: str
+    """
+    canonical = json.dumps(sorted((str(k), v) for k, v in index.items()), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def mark(evtx_file: str, indicators: str) -> Union[Dict[str, Any], None]:
+    """Return a checkpoint at the newest record of a log.
+
+    Taken before a log is read, so that records logged while it is read are read again next time
+    rather than missed.
+
+    :param evtx_file: The literal path to the evtx file.
+    :type evtx_file: str
+    :param indicators: The digest of the indicators that read it.
+    :type indicators: str
+    :return: The checkpoint, or None if the log holds no records.
+    :rtype: Union[Dict[str, Any], None]
+    """
+    bounds = HAS_LIBS and record_range(evtx_file)
+    if not bounds:
+        return None
+    record_id, filetime = bounds[1]
+    return {"record_id": record_id, "filetime": filetime, "indicators": indicators}
+
+
+def resume(
+    checkpoints: Dict[str, Dict[str, Any]], evtx_file: str, indicators: str
+) -> int:
+    """Return the record ID to read a log after, or 0 to read all of it.
+
+    The checkpoint's record must still be in the log with the same FILETIME, which identifies the
+    file even if it was collected again to a new path or copied. A log that was cleared, replaced,
+    or wrapped past the checkpoint is read in full, as is one whose indicators changed.
+
+    :param checkpoints: The saved checkpoints.
+    :type checkpoints: Dict[str, Dict[str, Any]]
+    :param evtx_file: The literal path to the evtx file.
+    :type evtx_file: str
+    :param indicators: The digest of the indicators that will read it.
+    :type indicators: str
+    :return: The last record ID read last time, or 0.
+    :rtype: int
+    """
+    checkpoint = checkpoints.get(os.path.abspath(evtx_file))
+    if not checkpoint or not HAS_LIBS:
+        return 0
+    record_id = checkpoint["record_id"]
+    bounds = record_range(evtx_file)
+    if checkpoint["indicators"] != indicators:
+        reason = "its indicators changed"
+    elif not bounds or bounds[1][0] < record_id:
+        reason = "it was cleared or replaced"
+    elif bounds[0][0] > record_id:
+        reason = "it wrapped past the last checkpoint"
+    elif find_record(evtx_file, record_id) != checkpoint["filetime"]:
+        reason = "it was replaced"
+    else:
+        logging.log(EVENTS, "Resuming {} after record {}.".format(evtx_file, record_id))
+        return record_id
+    logging.log(EVENTS, "Rescanning all of {}, {}.".format(evtx_file, reason))
+    return 0
@@ -0,0 +1,1106 @@
+"""Decodes evtx records straight from their BinXML templates into event dicts.
+
+python-evtx renders every record to an XML string, which evtx2json parses back
+into badgerfish dicts before splunkify and t_dict reshape it. Records built from
+the same template share their whole structure, so each template is compiled once
+per chunk and filled from the record's substitution array instead. The result is
+the same snake_case dict the XML round-trip produced.
+"""
+
+# Standard Python Libraries
+import base64
+from collections import Counter
+from datetime import date
+from functools import lru_cache, partial
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Tuple,
+    Union,
+)
+
+# Third-Party Libraries
+from Evtx.BinaryParser import parse_filetime
+import Evtx.Evtx as evtx
+import Evtx.Nodes as e_nodes
+from Evtx.Views import escape_value, validate_name
+
+# A compiled element is (tag, key, attributes, content, repeated tags). Attributes are
+# (key, "@" name, value piece). Content pieces are literal text, substitution indexes,
+# or nested compiled elements.
+Element = Tuple[str, str, Tuple, Tuple, frozenset]
+# A header is where a template keeps the System EventID text and Provider Name, as
+# (event ID piece, provider piece, (substitution, keys embedded BinXML must not add)).
+Header = Tuple[Union[str, int], Union[str, int, None], Tuple[Tuple[int, Any], ...]]
+# A compiled template is its top level elements, its header if it has a simple one, its
+# identity (template GUID and data size), and the substitutions that give Name attributes.
+Template = Tuple[Tuple[Element, ...], Union[Header, None], bytes, frozenset]
+
+
+class Event(dict):
+    """An event dict that also carries its shape.
+
+    Two events with the same shape have the same keys at every level, so anything worked out
+    from the layout of one holds for the other.
+    """
+
+    __slots__ = ("shape",)
+
+
+# escape_value only strips these once non-ASCII characters are already char refs.
+_RESTRICTED = re.compile("[\x01-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_TIMESTAMP = re.compile(
+    r"([0-9]{4})-([0-9]{2})-([0-9]{2}) ([0-9]{2}):([0-9]{2}):([0-9]{2})(?:\.[0-9]{1,6})?"
+)
+_TIMESTAMP_CHARS = re.compile(r"[\d\s.:-]*")
+_TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S")
+
+_FILE_HEADER = struct.Struct("<8s32xHH")  # Magic, header chunk size, chunk count
+_RECORD_HEADER = struct.Struct("<IIQQ")
+_RECORD_MAGIC = 0x00002A2A
+_DWORD = struct.Struct("<I")
+_CHUNK_MAGIC = b"ElfChnk\x00"
+_RECORD_SIGNATURE = _DWORD.pack(_RECORD_MAGIC)
+_CHUNK_SIZE = 0x10000
+_SID = struct.Struct(">BBIH")
+_GUID = struct.Struct("<IHH8s")
+_NUMBERS = {
+    0x03: struct.Struct("<b"),
+    0x04: struct.Struct("<B"),
+    0x05: struct.Struct("<h"),
+    0x06: struct.Struct("<H"),
+    0x07: struct.Struct("<i"),
+    0x08: struct.Struct("<I"),
+    0x09: struct.Struct("<q"),
+    0x0A: struct.Struct("<Q"),
+    0x0B: struct.Struct("<f"),
+    0x0C: struct.Struct("<d"),
+}
+# python-evtx refuses substitutions whose declared size is this far off the type's
+_FIXED_SIZES = {
+    0x03: 1,
+    0x04: 1,
+    0x05: 2,
+    0x06: 2,
+    0x07: 4,
+    0x08: 4,
+    0x09: 8,
+    0x0A: 8,
+    0x0B: 4,
+    0x0C: 8,
+    0x0D: 4,
+    0x0F: 16,
+    0x11: 8,
+    0x12: 16,
+    0x14: 4,
+    0x15: 8,
+}
+_BXML = 0x21
+# What events are decoded as: the snake_case dicts CHIRP matches, evtx2json's splunkify
+# output, or its badgerfish xml2json output without the splunkify tweaks
+LAYOUTS = ("chirp", "splunk", "xml")
+# The keys splunkify reshapes, snake_case and as XML names
+_KEYS = {
+    False: (
+        "system",
+        "event_data",
+        "data",
+        "name",
+        "time_created",
+        "system_time",
+        "computer",
+    ),
+    True: (
+        "System",
+        "EventData",
+        "Data",
+        "@Name",
+        "TimeCreated",
+        "@SystemTime",
+        "Computer",
+    ),
+}
+
+
+@lru_cache(maxsize=4096)
+def _no_camels(word: str) -> str:
+    """Take a CamelCase string and returns the snake_case equivalent.
+
+    Reference: `Stack Overflow <https://stackoverflow.com/a/1176023>`_
+    """
+    new_word = re.sub("(.)([A-Z][a-z]+)", r"\1_\2", word)
+    return re.sub("([a-z0-9])([A-Z])", r"\1_\2", new_word).lower().strip("@_")
+
+
+def _text(value: str) -> str:
+    """Return a value the way an XML parser reads it back out of element text."""
+    value = _RESTRICTED.sub("", value)
+    if "\r" in value:
+        value = value.replace("\r\n", "\n").replace("\r", "\n")
+    return value
+
+
+def _attribute(value: str) -> str:
+    """Return a value the way an XML parser reads it back out of an attribute."""
+    value = _text(value)
+    if "\n" in value or "\t" in value:
+        value = value.replace("\n", " ").replace("\t", " ")
+    return value
+
+
+def _convert(value: str) -> Any:
+    """Convert text to a bool, int, or float where possible, like xmljson does."""
+    first = value[:1]
+    if first.isascii() and first.isalpha() and first not in "tTfF":
+        return value
+    lowered = value.lower()
+    if lowered == "true":
+        return True
+    if lowered == "false":
+        return False
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    if float("-inf") < number < float("inf"):
+        return number
+    return value
+
+
+def _epoch(stamp: str) -> Union[float, None]:
+    """Return the local epoch time of a SystemTime value, or None if it does not parse."""
+    match = _TIMESTAMP.fullmatch(stamp)
+    if match:
+        year, month, day, hour, minute, second = map(int, match.groups())
+        if hour < 24 and minute < 60 and second < 60:
+            try:
+                date(year, month, day)
+            except ValueError:
+                return None
+            return time.mktime((year, month, day, hour, minute, second, 0, 1, -1))
+    if not _TIMESTAMP_CHARS.fullmatch(stamp):
+        return None
+    for fmt in _TIMESTAMP_FORMATS:
+        try:
+            return time.mktime(time.strptime(stamp, fmt))
+        except ValueError:
+            pass
+    return None
+
+
+def _compile_piece(node: Any) -> Union[str, int, Element, None]:
+    """Compile one template node into a content piece, or None if it renders nothing."""
+    if isinstance(node, e_nodes.OpenStartElementNode):
+        return _compile_element(node)
+    if isinstance(
+        node, (e_nodes.NormalSubstitutionNode, e_nodes.ConditionalSubstitutionNode)
+    ):
+        return node.index()
+    if isinstance(node, e_nodes.ValueNode):
+        return _text(node.children()[0].string())
+    if isinstance(node, e_nodes.CDataSectionNode):
+        return _text(escape_value(node.cdata()))
+    if isinstance(node, e_nodes.EntityReferenceNode):
+        return _text(node.entity_reference())
+    if isinstance(node, e_nodes.ProcessingInstructionTargetNode):
+        return _text(node.processing_instruction_target())
+    if isinstance(node, e_nodes.ProcessingInstructionDataNode):
+        return _text(node.string())
+    if isinstance(node, e_nodes.TemplateInstanceNode):
+        raise ValueError("Unexpected template instance inside a template.")
+    return None
+
+
+def _compile_element(node: Any) -> Element:
+    """Compile an element node of a template."""
+    tag = validate_name(node.tag_name()).rpartition(":")[2]
+    attributes = []
+    content = []
+    for child in node.children():
+        if isinstance(child, e_nodes.AttributeNode):
+            name = validate_name(child.attribute_name().string())
+            piece = _compile_piece(child.attribute_value())
+            if name == "xmlns" or name.startswith("xmlns:"):
+                continue  # Namespace declarations never reach the parsed tree
+            if piece.__class__ is str:
+                piece = _attribute(piece)
+            elif piece.__class__ is not int:
+                piece = ""
+            attributes.append((_no_camels("@" + name), "@" + name, piece))
+        else:
+            piece = _compile_piece(child)
+            if piece is not None:
+                content.append(piece)
+    tags = Counter(piece[0] for piece in content if piece.__class__ is tuple)
+    repeated = frozenset(t for t, count in tags.items() if count > 1)
+    return tag, _no_camels(tag), tuple(attributes), tuple(content), repeated
+
+
+def _only_child(element: Element, key: str) -> Union[Element, None]:
+    """Return the one static child element under a key, or None if there is not exactly one."""
+    children = [piece for piece in element[3] if piece.__class__ is tuple]
+    matches = [child for child in children if child[1] == key]
+    if len(matches) != 1 or matches[0][0] in element[4]:
+        return None
+    return matches[0]
+
+
+def _header(elements: Tuple[Element, ...]) -> Union[Header, None]:
+    """Find the pieces a template renders its System EventID text and Provider Name from.
+
+    Returns None unless both sit in plain, unrepeated elements, so the prefilter never guesses.
+    """
+    if len(elements) != 1 or elements[0][0] != "Event":
+        return None
+    system = _only_child(elements[0], "system")
+    event_id = system and _only_child(system, "event_id")
+    if event_id is None or len(event_id[3]) > 1:
+        return None
+    if event_id[3] and event_id[3][0].__class__ is tuple:
+        return None
+    event_id_piece = event_id[3][0] if event_id[3] else ""
+
+    provider_piece = None
+    provider = _only_child(system, "provider")
+    if provider is not None:
+        if any(piece.__class__ is tuple for piece in provider[3]):
+            return None
+        for key, _, piece in provider[2]:
+            if key == "name":
+                provider_piece = piece
+    elif any(child[1] == "provider" for child in system[3] if child.__class__ is tuple):
+        return None  # Repeated Provider elements render as a list
+
+    # Embedded BinXML can add elements the template does not show. Under Event and System
+    # that only matters if they share a key with what we read, inside EventID or Provider
+    # it always does.
+    guards = tuple(
+        (piece, keys)
+        for element, keys in (
+            (elements[0], frozenset(["system"])),
+            (system, frozenset(["event_id", "provider"])),
+            (event_id, None),
+            (provider, None),
+        )
+        if element is not None
+        for piece in element[3]
+        if piece.__class__ is int
+    )
+    return event_id_piece, provider_piece, guards
+
+
+def _named(elements: Tuple[Element, ...]) -> frozenset:
+    """Return the substitutions that fill Name attributes, which become keys of event_data."""
+    named = set()
+    for element in elements:
+        named.update(
+            p for key, _, p in element[2] if key == "name" and p.__class__ is int
+        )
+        named.update(_named(tuple(p for p in element[3] if p.__class__ is tuple)))
+    return frozenset(named)
+
+
+def _compile(buf: mmap.mmap, offset: int, chunk: Any) -> Template:
+    """Compile the template at an absolute offset into its top level elements and header."""
+    node = e_nodes.TemplateNode(buf, offset, chunk, chunk)
+    elements = tuple(
+        _compile_element(child)
+        for child in node.children()
+        if isinstance(child, e_nodes.OpenStartElementNode)
+    )
+    identity = bytes(buf[offset + 0x04 : offset + 0x18])
+    return elements, _header(elements), identity, _named(elements)
+
+
+def _value(buf: mmap.mmap, offset: int, size: int, kind: int, chunk: Any) -> str:
+    """Return the string python-evtx would render for a substitution value."""
+    if kind == 0x01:
+        return (
+            bytes(buf[offset : offset + size // 2 * 2]).decode("utf16").rstrip("\x00")
+        )
+    if kind == 0x00:
+        return ""
+    fixed = _FIXED_SIZES.get(kind)
+    if fixed is not None and abs(size - fixed) > 4:
+        raise ValueError("Invalid substitution value size")
+    if kind in _NUMBERS:
+        return str(_NUMBERS[kind].unpack_from(buf, offset)[0])
+    if kind == 0x14:
+        return "0x{:08x}".format(_DWORD.unpack_from(buf, offset)[0])
+    if kind == 0x15:
+        return "0x{:016x}".format(_NUMBERS[0x0A].unpack_from(buf, offset)[0])
+    if kind == 0x11:
+        qword = _NUMBERS[0x0A].unpack_from(buf, offset)[0]
+        return parse_filetime(qword).isoformat(" ")
+    if kind == 0x13:
+        version, elements, high, low = _SID.unpack_from(buf, offset)
+        if abs(size - 8 - 4 * elements) > 4:
+            raise ValueError("Invalid substitution value size")
+        sid = "S-{}-{}".format(version, (high << 16) ^ low)
+        for element in struct.unpack_from("<{}I".format(elements), buf, offset + 8):
+            sid += "-{}".format(element)
+        return sid
+    if kind == 0x0F:
+        first, second, third, rest = _GUID.unpack_from(buf, offset)
+        return "{{{:08x}-{:04x}-{:04x}-{}-{}}}".format(
+            first, second, third, rest[:2].hex(), rest[2:].hex()
+        )
+    if kind == 0x0D:
+        return "True" if _NUMBERS[0x07].unpack_from(buf, offset)[0] > 0 else "False"
+    if kind == 0x0E:
+        return base64.b64encode(bytes(buf[offset : offset + size])).decode("ascii")
+    return e_nodes.get_variant_value(
+        buf, offset, chunk, None, kind, length=size
+    ).string()
+
+
+def _instance(
+    buf: mmap.mmap, offset: int, chunk: Any, templates: Dict[int, Template]
+) -> Tuple[Template, Tuple[int, ...], int]:
+    """Parse the BinXML root at an offset without decoding any substitution values.
+
+    :return: The compiled template, the flat (size, type, ...) substitution declarations, and the offset of the first value.
+    """
+    if buf[offset] & 0x0F == 0x0F:
+        offset += 4  # Skip the fragment header
+    if buf[offset] & 0x0F != 0x0C:
+        raise ValueError("Expected a template instance at {}.".format(hex(offset)))
+    template_offset = _DWORD.unpack_from(buf, offset + 6)[0]
+    chunk_offset = chunk.offset()
+    if template_offset > offset - chunk_offset:
+        # The template definition is resident in this record, skip past it.
+        offset += (
+            0x18 + _DWORD.unpack_from(buf, chunk_offset + template_offset + 0x14)[0]
+        )
+    offset += 10
+    try:
+        template = templates[template_offset]
+    except KeyError:
+        template = templates[template_offset] = _compile(
+            buf, chunk_offset + template_offset, chunk
+        )
+
+    count = _DWORD.unpack_from(buf, offset)[0]
+    declarations = struct.unpack_from("<" + "HBx" * count, buf, offset + 4)
+    return template, declarations, offset + 4 + 4 * count
+
+
+def _root(
+    buf: mmap.mmap, offset: int, chunk: Any, templates: Dict[int, Template]
+) -> Tuple[Template, List]:
+    """Return the compiled template and the substitutions of the BinXML root at an offset.
+
+    Substitutions are strings, except for embedded BinXML which is returned as its own (template, substitutions).
+    """
+    template, declarations, offset = _instance(buf, offset, chunk, templates)
+    subs = []
+    for i in range(0, len(declarations), 2):
+        size, kind = declarations[i], declarations[i + 1]
+        if kind == _BXML:
+            subs.append(_root(buf, offset, chunk, templates))
+        else:
+            subs.append(_value(buf, offset, size, kind, chunk))
+        offset += size
+    return template, subs
+
+
+def _header_values(
+    buf: mmap.mmap,
+    header: Header,
+    declarations: Tuple[int, ...],
+    offset: int,
+    chunk: Any,
+    templates: Dict[int, Template],
+) -> Union[Tuple[str, Any], None]:
+    """Decode just the event ID, as scan compares it, and the provider name of a record.
+
+    Returns None when embedded BinXML means only a full render can tell.
+    """
+    event_id, provider, guards = header
+    if any(index * 2 >= len(declarations) for index, _ in guards):
+        return None
+    guards = {
+        index: keys for index, keys in guards if declarations[index * 2 + 1] == _BXML
+    }
+    needed = {piece for piece in (event_id, provider) if piece.__class__ is int}
+    values = {}
+    for i in range(0, 2 * max(needed | guards.keys(), default=-1) + 2, 2):
+        index = i // 2
+        if index in guards:
+            keys = guards[index]
+            if keys is None:
+                return None
+            embedded = _instance(buf, offset, chunk, templates)[0][0]
+            if any(element[1] in keys for element in embedded):
+                return None
+        if index in needed:
+            values[index] = _value(
+                buf, offset, declarations[i], declarations[i + 1], chunk
+            )
+        offset += declarations[i]
+
+    text = _text(values[event_id]) if event_id.__class__ is int else event_id
+    event_id = str(_convert(text)) if text.strip() else "None"
+    if provider.__class__ is int:
+        provider = _convert(_attribute(values[provider]))
+    elif provider is not None:
+        provider = _convert(provider)
+    return event_id, provider
+
+
+def _shape(template: Template, subs: List) -> Tuple:
+    """Return what decides the keys of a rendered record.
+
+    Those are its template, which substitutions render as blank text (dropping a "$" key), the
+    values that name event_data keys, and the same for any embedded BinXML.
+    """
+    shape = []
+    for i, sub in enumerate(subs):
+        if sub.__class__ is tuple:
+            shape.append(_shape(*sub))
+        elif i in template[3]:
+            shape.append(sub)
+        else:
+            shape.append(not (sub if sub.isprintable() else _text(sub)).strip())
+    return template[2], tuple(shape)
+
+
+def _render(
+    template: Template, subs: List, camel: bool = False
+) -> List[Tuple[str, str, Dict]]:
+    """Fill a compiled template's elements with a record's substitutions."""
+    return [
+        (element[0], element[1], _element(element, subs, camel))
+        for element in template[0]
+    ]
+
+
+def _element(element: Element, subs: List, camel: bool = False) -> Dict:
+    """Build the badgerfish dict of one element, with snake_case keys, or its XML names if camel."""
+    _, _, attributes, content, repeated = element
+    value = {}
+    for key, name, piece in attributes:
+        if camel:
+            key = name
+        if piece.__class__ is int:
+            piece = subs[piece]
+            if piece.__class__ is not str:
+                raise ValueError("Embedded BinXML in an attribute value.")
+            piece = _attribute(piece)
+        value[key] = _convert(piece)
+
+    parts = []
+    children = []
+    embedded = False
+    for piece in content:
+        if piece.__class__ is str:
+            if not children:
+                parts.append(piece)
+        elif piece.__class__ is int:
+            sub = subs[piece]
+            if sub.__class__ is str:
+                if not children:
+                    parts.append(_text(sub))
+            else:
+                children += _render(*sub, camel)
+                embedded = True
+        else:
+            children.append((piece[0], piece[1], _element(piece, subs, camel)))
+
+    if parts:
+        text = "".join(parts)
+        if text.strip():
+            value["$"] = _convert(text)
+    if embedded:
+        tags = Counter(tag for tag, _, _ in children)
+        repeated = frozenset(tag for tag, count in tags.items() if count > 1)
+    for tag, key, child in children:
+        if camel:
+            key = tag
+        if tag in repeated:
+            group = value.get(key)
+            if group.__class__ is not list:
+                group = value[key] = []
+            group.append(child)
+        else:
+            value[key] = child
+    return value
+
+
+def _finalise(event: Dict, source: str, camel: bool = False) -> Dict:
+    """Apply evtx2json's splunkify reshaping to a rendered Event element, keyed as it was rendered."""
+    system_key, data_key, data, name_key, created, system_time, computer = _KEYS[camel]
+    system = event.get(system_key)
+    if system.__class__ is dict:
+        del event[system_key]
+        event[system_key] = {
+            k: v["$"] if v.__class__ is dict and len(v) == 1 and "$" in v else v
+            for k, v in system.items()
+        }
+
+    if data_key in event:
+        try:
+            event_data = {}
+            for item in event[data_key][data]:
+                name = item[name_key]
+                if name.__class__ is str and not camel:
+                    name = _no_camels(name)
+                event_data[name] = item.get("$")
+        except (KeyError, TypeError):
+            pass  # Unnamed or missing Data is left as it was
+        else:
+            del event[data_key]
+            event[data_key] = event_data
+
+    fields = event["fields"] = {}
+    try:
+        stamp = event[system_key][created][system_time]
+    except KeyError:
+        pass
+    else:
+        epoch = _epoch(stamp.strip())
+        if epoch is not None:
+            fields["time"] = epoch
+    try:
+        fields["host"] = event[system_key][computer]
+    except KeyError:
+        pass
+    fields["source"] = source
+    return event
+
+
+def _decode(
+    buf: mmap.mmap,
+    offset: int,
+    chunk: Any,
+    templates: Dict[int, Template],
+    source: str,
+    wanted: Callable[[str, Any], bool] = None,
+    layout: str = "chirp",
+) -> Union[Dict, None]:
+    """Decode the record at an absolute offset into its event dict, or None if wanted turns it away.
+
+    The layout is one of LAYOUTS, and only the "chirp" layout is wrapped in an Event with its shape.
+    """
+    template, declarations, values = _instance(buf, offset + 0x18, chunk, templates)
+    if wanted is not None and template[1] is not None:
+        header = _header_values(
+            buf, template[1], declarations, values, chunk, templates
+        )
+        if header is not None and not wanted(*header):
+            return None
+    root = _root(buf, offset + 0x18, chunk, templates)
+    camel = layout != "chirp"
+    elements = _render(*root, camel)
+    if len(elements) != 1 or elements[0][0] != "Event":
+        raise ValueError("Record at {} is not an Event.".format(hex(offset)))
+    if layout == "xml":
+        return elements[0][2]
+    if camel:
+        return _finalise(elements[0][2], source, camel)
+    event = Event(event=_finalise(elements[0][2], source))
+    event.shape = _shape(*root)
+    return event
+
+
+def _record_offsets(buf: mmap.mmap, chunk: Any) -> Iterator[int]:
+    """Yield the absolute offset of every record in a chunk, walking them the way python-evtx does."""
+    return _walk_records(buf, chunk.offset(), chunk.next_record_offset())
+
+
+def _walk_records(buf: mmap.mmap, chunk_offset: int, next_record: int) -> Iterator[int]:
+    """Yield the absolute offset of every record before next_record in the chunk at chunk_offset."""
+    offset = chunk_offset + 0x200
+    end = chunk_offset + next_record
+    while offset < end:
+        try:
+            size = _RECORD_HEADER.unpack_from(buf, offset)[1]
+        except struct.error:
+            return
+        if size == 0 or size > 0x10000:
+            return
+        yield offset
+        offset += size
+
+
+def _chunk_offsets(buf: mmap.mmap, start: int = 0, stop: int = None) -> Iterator[int]:
+    """Yield the offsets of the chunks in [start, stop), bounded the way python-evtx bounds them."""
+    _, header_size, count = _FILE_HEADER.unpack_from(buf, 0x0)
+    count = min(count, (len(buf) - header_size) // 0x10000)
+    for i in range(start, count if stop is None else min(stop, count)):
+        yield header_size + i * 0x10000
+
+
+def _chunks(buf: mmap.mmap, start: int = 0, stop: int = None) -> Iterator[Any]:
+    """Yield the chunk headers in [start, stop)."""
+    for offset in _chunk_offsets(buf, start, stop):
+        yield evtx.ChunkHeader(buf, offset)
+
+
+def _record_header(buf: mmap.mmap, offset: int) -> Union[Tuple[int, int], None]:
+    """Return the record ID and FILETIME in the header of the record at offset, or None if there is no record there."""
+    try:
+        magic, _, record_id, timestamp = _RECORD_HEADER.unpack_from(buf, offset)
+    except struct.error:
+        return None
+    return (record_id, timestamp) if magic == _RECORD_MAGIC else None
+
+
+def _chunk_bounds(
+    buf: mmap.mmap, offset: int
+) -> Union[Tuple[Tuple[int, int], Tuple[int, int]], None]:
+    """Return the record headers of the first and last records of the chunk at offset.
+
+    Records are appended to a chunk as they are logged, so these two bound the IDs and times of the
+    rest. Returns None when either cannot be read.
+    """
+    last = _DWORD.unpack_from(buf, offset + 0x2C)[0]
+    first, last = _record_header(buf, offset + 0x200), _record_header(
+        buf, offset + last
+    )
+    if first is None or last is None:
+        return None
+    return min(first, last), max(first, last)
+
+
+def _outside(
+    header: Tuple[int, int], since: int = None, until: int = None, after: int = 0
+) -> bool:
+    """Return whether a record header falls outside [since, until], or at or before record ID after."""
+    record_id, timestamp = header
+    return (
+        record_id <= after
+        or (since is not None and timestamp < since)
+        or (until is not None and timestamp > until)
+    )
+
+
+def _chunk_span(
+    buf: mmap.mmap, offset: int
+) -> Union[Tuple[Tuple[int, int], Tuple[int, int]], None]:
+    """Return the lowest and the highest record ID and FILETIME over every record header of the chunk at offset.
+
+    Times are not assumed to rise through a chunk, since a clock change or a tampered log breaks
+    that. Returns None when no record header can be read.
+    """
+    try:
+        next_record = _DWORD.unpack_from(buf, offset + 0x30)[0]
+    except struct.error:
+        return None
+    headers = [
+        header
+        for header in map(
+            partial(_record_header, buf), _walk_records(buf, offset, next_record)
+        )
+        if header
+    ]
+    if not headers:
+        return None
+    record_ids, timestamps = zip(*headers)
+    return (min(record_ids), min(timestamps)), (max(record_ids), max(timestamps))
+
+
+def _in_window(
+    buf: mmap.mmap, offset: int, since: int = None, until: int = None, after: int = 0
+) -> bool:
+    """Return whether the chunk at offset may hold records inside [since, until] and after record ID after.
+
+    Chunk headers only carry record number ranges, so the header of every record in the chunk is
+    read for its time range. A chunk is only ruled out when every record in it must be.
+    """
+    span = _chunk_span(buf, offset)
+    if span is None:
+        return True
+    low, high = span
+    return (
+        high[0] > after
+        and (since is None or high[1] >= since)
+        and (until is None or low[1] <= until)
+    )
+
+
+def _read(
+    buf: mmap.mmap,
+    chunk: Any,
+    offsets: Iterator[int],
+    source: str,
+    wanted: Union[Callable[[str, Any], bool], None],
+    window: Union[Tuple[int, int, int], None],
+    failed: Counter,
+    layout: str = "chirp",
+    mark: bool = False,
+) -> Iterator[Union[Dict, None]]:
+    """Decode the records of a chunk at offsets, leaving out those outside the (since, until, after) window.
+
+    Templates are compiled once for the chunk. Records that fail to decode are counted in failed.
+    With mark, each event's fields also get the offset of its record in the file, which tells
+    apart carved records that share a record ID.
+    """
+    templates = {}
+    for offset in offsets:
+        if window is not None:
+            header = _record_header(buf, offset)
+            if header and _outside(header, *window):
+                continue
+        try:
+            event = _decode(buf, offset, chunk, templates, source, wanted, layout)
+        except Exception:
+            failed["records"] += 1
+            continue
+        if mark and event:
+            event["event"]["fields"]["offset"] = offset
+        yield event
+
+
+def _valid_record(buf: mmap.mmap, offset: int, end: int) -> int:
+    """Return the size of the record at offset if it checks out and ends by end, else 0.
+
+    A record starts with its magic and size, ends with a copy of its size, and its BinXML starts
+    with a fragment header, which together rule out nearly every stray match of the magic.
+    """
+    try:
+        magic, size, record_id, _ = _RECORD_HEADER.unpack_from(buf, offset)
+    except struct.error:
+        return 0
+    if magic != _RECORD_MAGIC or not record_id or size < 0x20 or offset + size > end:
+        return 0
+    if _DWORD.unpack_from(buf, offset + size - 4)[0] != size:
+        return 0
+    return size if buf[offset + 0x18] == 0x0F else 0
+
+
+def _carved_records(buf: mmap.mmap, offset: int) -> Iterator[int]:
+    """Yield the offset of every valid record in the chunk at offset, searching for record signatures.
+
+    The chunk header's record offsets are not trusted. After a damaged record the search picks up at
+    the next signature, so one bad record does not cost the rest of the chunk.
+    """
+    end = min(offset + _CHUNK_SIZE, len(buf))
+    position = offset + 0x200
+    while True:
+        position = buf.find(_RECORD_SIGNATURE, position, end)
+        if position < 0:
+            return
+        size = _valid_record(buf, position, end)
+        if size:
+            yield position
+            position += size
+        else:
+            position += 1
+
+
+def count_blocks(evtx_file: str) -> int:
+    """Return how many 64 KB blocks a file spans, the units it is carved in.
+
+    :param evtx_file: The literal path to the evtx file or raw image.
+    :type evtx_file: str
+    :return: The number of blocks.
+    :rtype: int
+    """
+    return -(-os.path.getsize(evtx_file) // _CHUNK_SIZE)
+
+
+def _carved_chunks(buf: mmap.mmap, start: int = 0, stop: int = None) -> Iterator[int]:
+    """Yield the offset of every chunk signature that starts in the 64 KB blocks [start, stop)."""
+    end = len(buf) if stop is None else min(len(buf), stop * _CHUNK_SIZE)
+    # A chunk whose signature starts before end belongs to this range
+    bound = min(len(buf), end + len(_CHUNK_MAGIC) - 1)
+    offset = buf.find(_CHUNK_MAGIC, start * _CHUNK_SIZE, bound)
+    while offset >= 0:
+        yield offset
+        offset = buf.find(_CHUNK_MAGIC, offset + len(_CHUNK_MAGIC), bound)
+
+
+def carved_copies(
+    evtx_file: str, spans: List[Tuple[int, int]]
+) -> List[FrozenSet[Tuple[int, int]]]:
+    """Return the records carving would find more than once, for each range of blocks it is split into.
+
+    Slack space and duplicated or overlapping chunks hold copies of records. A record is a copy
+    when an earlier one in the file has the same record ID, FILETIME and bytes, so only the first
+    is read, however the file is split between tasks.
+
+    :param evtx_file: The literal path to the evtx file or raw image.
+    :type evtx_file: str
+    :param spans: The [start, stop) ranges of 64 KB blocks that are carved apart.
+    :type spans: List[Tuple[int, int]]
+    :return: For each span, the (chunk offset, record offset) of every copy carve_events should skip.
+    :rtype: List[FrozenSet[Tuple[int, int]]]
+    """
+    copies = [set() for _ in spans]
+    if not spans or not os.path.getsize(evtx_file):
+        return [frozenset(c) for c in copies]
+    seen = set()
+    with open(evtx_file, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buf:
+        for chunk in _carved_chunks(buf, 0, max(stop for _, stop in spans)):
+            for offset in _carved_records(buf, chunk):
+                _, size, record_id, timestamp = _RECORD_HEADER.unpack_from(buf, offset)
+                key = (
+                    record_id,
+                    timestamp,
+                    hashlib.sha1(buf[offset : offset + size]).digest(),  # nosec
+                )
+                if key not in seen:
+                    seen.add(key)
+                    continue
+                for i, (start, stop) in enumerate(spans):
+                    if start <= chunk // _CHUNK_SIZE < stop:
+                        copies[i].add((chunk, offset))
+    return [frozenset(c) for c in copies]
+
+
+def carve_events(
+    evtx_file: str,
+    source: str = None,
+    start: int = 0,
+    stop: int = None,
+    wanted: Callable[[str, Any], bool] = None,
+    since: int = None,
+    until: int = None,
+    after: int = 0,
+    copies: Collection[Tuple[int, int]] = (),
+) -> Iterator[Union[Dict, None]]:
+    """Yield every record that can be recovered from a dirty evtx file or a raw image, as an event dict.
+
+    The file header and chunk positions are not trusted. Chunks are found by searching the mapped
+    file for their signature at any offset, and their records by searching for the record signature,
+    so damaged, truncated or misaligned logs and copies of chunks left in slack space are read as
+    far as they hold together. Records without a chunk header before them are not recovered, since
+    their templates and strings are found through it. A chunk is carved by the block its signature
+    starts in, so separate block ranges of one file can be carved in parallel. Each event's fields
+    also hold the offset of its record, since record IDs can repeat across the logs of an image.
+    Arguments and events are otherwise as for iter_events.
+
+    :param evtx_file: The literal path to the evtx file or raw image.
+    :type evtx_file: str
+    :param source: A name to report as the source of each event, defaults to the file name.
+    :type source: str, optional
+    :param start: The first 64 KB block to carve chunks from, defaults to 0
+    :type start: int, optional
+    :param stop: The block to stop before, defaults to None which carves to the end of the file.
+    :type stop: int, optional
+    :param wanted: A prefilter on the header fields of each record, defaults to None
+    :type wanted: Callable[[str, Any], bool], optional
+    :param since: The earliest FILETIME to read, defaults to None
+    :type since: int, optional
+    :param until: The latest FILETIME to read, defaults to None
+    :type until: int, optional
+    :param after: Only read records with a higher record ID, defaults to 0
+    :type after: int, optional
+    :param copies: The (chunk offset, record offset) of records to skip, from carved_copies, defaults to ()
+    :type copies: Collection[Tuple[int, int]], optional
+    :yield: The event dict, or None if it was filtered out.
+    :rtype: Iterator[Union[Dict, None]]
+    """
+    source = source or os.path.basename(evtx_file)
+    failed, chunks = Counter(), 0
+    if not os.path.getsize(evtx_file):
+        return
+    with open(evtx_file, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buf:
+        windowed = since is not None or until is not None or after
+        window = (since, until, after) if windowed else None
+        for offset in _carved_chunks(buf, start, stop):
+            chunks += 1
+            yield from _read(
+                buf,
+                evtx.ChunkHeader(buf, offset),
+                (
+                    record
+                    for record in _carved_records(buf, offset)
+                    if (offset, record) not in copies
+                ),
+                source,
+                wanted,
+                window,
+                failed,
+                mark=True,
+            )
+    logging.info("Carved {} chunks from {}.".format(chunks, evtx_file))
+    if failed["records"]:
+        logging.error("Failed to read {} events.".format(failed["records"]))
+
+
+def count_chunks(evtx_file: str) -> int:
+    """Return how many chunks of an evtx file hold records.
+
+    :param evtx_file: The literal path to the evtx file.
+    :type evtx_file: str
+    :return: The number of chunks, 0 if the file is too short to have any.
+    :rtype: int
+    """
+    with open(evtx_file, "rb") as f:
+        header = f.read(_FILE_HEADER.size)
+    if len(header) < _FILE_HEADER.size:
+        return 0
+    _, header_size, count = _FILE_HEADER.unpack(header)
+    return max(0, min(count, (os.path.getsize(evtx_file) - header_size) // 0x10000))
+
+
+def window_chunks(
+    evtx_file: str, since: int = None, until: int = None, after: int = 0
+) -> List[int]:
+    """Return the chunks of an evtx file that may hold records logged inside [since, until] after a record ID.
+
+    Only the fixed size headers of each chunk's records are read, so ruling out chunks costs next
+    to nothing next to decoding them.
+
+    :param evtx_file: The literal path to the evtx file.
+    :type evtx_file: str
+    :param since: The earliest FILETIME to keep, defaults to None
+    :type since: int, optional
+    :param until: The latest FILETIME to keep, defaults to None
+    :type until: int, optional
+    :param after: The record ID to keep records after, defaults to 0
+    :type after: int, optional
+    :return: The chunk indexes, in file order.
+    :rtype: List[int]
+    """
+    count = count_chunks(evtx_file)
+    if not count or (since is None and until is None and not after):
+        return list(range(count))
+    with open(evtx_file, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buf:
+        return [
+            i
+            for i, offset in enumerate(_chunk_offsets(buf))
+            if _in_window(buf, offset, since, until, after)
+        ]
+
+
+def record_range(
+    evtx_file: str,
+) -> Union[Tuple[Tuple[int, int], Tuple[int, int]], None]:
+    """Return the (record ID, FILETIME) of the oldest and newest records in an evtx file.
+
+    :param evtx_file: The literal path to the evtx file.
+    :type evtx_file: str
+    :return: The oldest and newest record headers, or None if the file holds no records.
+    :rtype: Union[Tuple[Tuple[int, int], Tuple[int, int]], None]
+    """
+    if not count_chunks(evtx_file):
+        return None
+    with open(evtx_file, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buf:
+        bounds = [_chunk_bounds(buf, offset) for offset in _chunk_offsets(buf)]
+    bounds = [b for b in bounds if b]
+    if not bounds:
+        return None
+    return min(b[0] for b in bounds), max(b[1] for b in bounds)
+
+
+def find_record(evtx_file: str, record_id: int) -> Union[int, None]:
+    """Return the FILETIME of a record in an evtx file, looking only in the chunk that can hold it.
+
+    :param evtx_file: The literal path to the evtx file.
+    :type evtx_file: str
+    :param record_id: The record ID to look for.
+    :type record_id: int
+    :return: The FILETIME of the record, or None if the file does not hold it.
+    :rtype: Union[int, None]
+    """
+    if not count_chunks(evtx_file):
+        return None
+    with open(evtx_file, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buf:
+        for chunk in _chunks(buf):
+            bounds = _chunk_bounds(buf, chunk.offset())
+            if bounds and not bounds[0][0] <= record_id <= bounds[1][0]:
+                continue
+            for offset in _record_offsets(buf, chunk):
+                header = _record_header(buf, offset)
+                if header and header[0] == record_id:
+                    return header[1]
+    return None
+
+
+def iter_events(
+    evtx_file: str,
+    source: str = None,
+    start: int = 0,
+    stop: int = None,
+    wanted: Callable[[str, Any], bool] = None,
+    since: int = None,
+    until: int = None,
+    after: int = 0,
+    layout: str = "chirp",
+    failed: Counter = None,
+) -> Iterator[Union[Dict, None]]:
+    """Yield every record of an evtx file, or of a range of its chunks, as a snake_case event dict.
+
+    Chunks are independent of each other, so separate ranges of one file can be read in parallel.
+    When wanted is given, it is first called with a record's event ID (as a string) and provider
+    name, which are decoded without rendering the rest of the record. Records it turns away are
+    yielded as None so callers can still count them. When since, until or after is given, chunks
+    wholly outside the window are skipped and records outside it are left out entirely, compared
+    on their header record ID and FILETIME before anything is decoded.
+
+    :param evtx_file: The literal path to the evtx file.
+    :type evtx_file: str
+    :param source: A name to report as the source of each event, defaults to the file name.
+    :type source: str, optional
+    :param start: The first chunk to read, defaults to 0
+    :type start: int, optional
+    :param stop: The chunk to stop before, defaults to None which reads to the end of the file.
+    :type stop: int, optional
+    :param wanted: A prefilter on the header fields of each record, defaults to None
+    :type wanted: Callable[[str, Any], bool], optional
+    :param since: The earliest FILETIME to read, defaults to None
+    :type since: int, optional
+    :param until: The latest FILETIME to read, defaults to None
+    :type until: int, optional
+    :param after: Only read records with a higher record ID, defaults to 0
+    :type after: int, optional
+    :param layout: One of LAYOUTS, defaults to "chirp"
+    :type layout: str, optional
+    :param failed: A Counter to count records that fail to decode into, under "records", defaults to None
+    :type failed: Counter, optional
+    :yield: The event dict, shaped like evtx2json's output after t_dict, or None if it was filtered out.
+    :rtype: Iterator[Union[Dict, None]]
+    """
+    source = source or os.path.basename(evtx_file)
+    failed = Counter() if failed is None else failed
+    if not count_chunks(evtx_file):
+        return
+    with open(evtx_file, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buf:
+        windowed = since is not None or until is not None or after
+        window = (since, until, after) if windowed else None
+        for chunk in _chunks(buf, start, stop):
+            if windowed and not _in_window(buf, chunk.offset(), *window):
+                continue
+            yield from _read(
+                buf,
+                chunk,
+                _record_offsets(buf, chunk),
+                source,
+                wanted,
+                window,
+                failed,
+                layout,
+            )
+    if failed["records"]:
+        logging.error("Failed to read {} events.".format(failed["records"]))
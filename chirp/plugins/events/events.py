@@ -1,27 +1,43 @@
 """Generates usable dictionaries from event log data."""
 
 # Standard Python Libraries
+from datetime import datetime, timezone
 from functools import lru_cache
 import logging
 import os
 from pathlib import Path
-import re
 import string
 import sys
-from typing import Any, Dict, Iterator, List, Union
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Tuple,
+    Union,
+)
 
 # cisagov Libraries
-from chirp.common import EVENTS, JSON, OS
+from chirp.common import CARVE, EVENTS, EVTX_DIR, JSON, OS, SINCE, UNTIL
 
 HAS_LIBS = False
 try:
     # cisagov Libraries
-    from chirp.plugins.events.evtx2json import iter_evtx2xml, splunkify, xml2json
+    from chirp.plugins.events.decoder import (
+        carve_events,
+        carved_copies,
+        count_blocks,
+        iter_events,
+        window_chunks,
+    )
 
     HAS_LIBS = True
 except ImportError:
     logging.error(
-        "(EVENTS) python-evtx, dict-toolbox, and xmljson are required dependencies for the events plugin. Please install requirements with pip."
+        "(EVENTS) python-evtx is a required dependency for the events plugin. Please install requirements with pip."
     )
 
 if OS == "Windows":
@@ -30,6 +46,28 @@ if OS == "Windows":
 
 PATH = Path(sys.executable)
 
+_FILETIME_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
+
+
+def _filetime(point: Union[datetime, None]) -> Union[int, None]:
+    """Return a point in time as a FILETIME, the 100ns ticks since 1601 that record headers hold.
+
+    :param point: An aware datetime, or None
+    :type point: Union[datetime, None]
+    :return: The FILETIME, or None if no point was given.
+    :rtype: Union[int, None]
+    """
+    if point is None:
+        return None
+    delta = point - _FILETIME_EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10**7 + delta.microseconds * 10
+
+
+@lru_cache(maxsize=None)
+def window() -> Tuple[Union[int, None], Union[int, None]]:
+    """Return the --since/--until window as FILETIMEs, compared as-is against record headers so no timestamp is parsed."""
+    return _filetime(SINCE), _filetime(UNTIL)
+
 
 def _get_drives() -> List[str]:
     """
@@ -60,75 +98,212 @@ def _path_iterator():
     return None
 
 
-default_dir = _path_iterator()
+@lru_cache(maxsize=None)
+def default_dir() -> Union[str, None]:
+    """Return the path template of the live event logs, probing the drives for them the first time it is asked.
 
-if not default_dir:
-    if OS == "Windows":
+    :return: The template, with {} for the event type, or None if there are no live logs.
+    :rtype: Union[str, None]
+    """
+    found = _path_iterator()
+    if not found and OS == "Windows":
         logging.log(EVENTS, "We can't find windows event logs at their standard path.")
-    HAS_LIBS = False
+    return found
 
 
-if HAS_LIBS:
+def corpus_logs(event_type: str, root: str = EVTX_DIR) -> Iterator[str]:
+    """Yield every collected evtx file for an event type under a directory tree. Ex: "Security" yields each host's Security.evtx.
 
-    @lru_cache(maxsize=128)
-    def _no_camels(word: str) -> str:
-        """Take a CamelCase string and returns the snake_case equivalent.
+    :param event_type: An event log to look for.
+    :type event_type: str
+    :param root: The directory tree to walk, defaults to the --evtx-dir argument.
+    :type root: str, optional
+    :yield: Paths to matching evtx files.
+    :rtype: Iterator[str]
+    """
+    for dirpath, _, filenames in sorted(os.walk(root)):
+        for filename in sorted(filenames):
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() == ".evtx" and stem.lower() == event_type.lower():
+                yield os.path.join(dirpath, filename)
 
-        Reference: `Stack Overflow <https://stackoverflow.com/a/1176023>`_
-        """
-        new_word = re.sub("(.)([A-Z][a-z]+)", r"\1_\2", word)
-        return re.sub("([a-z0-9])([A-Z])", r"\1_\2", new_word).lower().strip("@_")
 
-    # Leverages evtx2json, written by @vavarachen to parse event logs into JSON data.
-    # https://github.com/vavarachen/evtx2json << We had to copy the file to our repo because it's not in PYPI
-    # This library in turn leverages python-evtx written by @williballenthin
+def corpus_host(evtx_file: str, root: str = EVTX_DIR) -> Union[str, None]:
+    """Return the host a collected evtx file belongs to, taken from its top level directory under the corpus root.
+
+    :param evtx_file: The path to a collected evtx file.
+    :type evtx_file: str
+    :param root: The corpus root, defaults to the --evtx-dir argument.
+    :type root: str, optional
+    :return: The host directory name, or None if the file sits directly in the root.
+    :rtype: Union[str, None]
+    """
+    parts = os.path.relpath(evtx_file, root).split(os.sep)
+    return parts[0] if len(parts) > 1 else None
+
+
+def log_file(event_type: str, evtx_file: str = None) -> Union[str, None]:
+    """Return the path an event log is read from. Ex: "Security" is the live Security.evtx.
+
+    :param event_type: An event log.
+    :type event_type: str
+    :param evtx_file: A collected evtx file to read instead of the live log, defaults to None
+    :type evtx_file: str, optional
+    :return: The path, or None if there is no live log to read.
+    :rtype: Union[str, None]
+    """
+    if evtx_file or not default_dir():
+        return evtx_file
+    return default_dir().format(event_type)
+
+
+if HAS_LIBS:
+
+    # Leverages python-evtx written by @williballenthin to walk the BinXML of each record.
     # https://github.com/williballenthin/python-evtx
-    def process_files(evtx_file: str) -> Iterator[JSON]:
+    # Events are built in the shape evtx2json (written by @vavarachen) gave us, without rendering XML.
+    def process_files(
+        evtx_file: str,
+        source: str = None,
+        chunks: Tuple[int, int] = (0, None),
+        wanted: Callable[[str, Any], bool] = None,
+        after: int = 0,
+        copies: Collection[Tuple[int, int]] = (),
+    ) -> Iterator[Union[JSON, None]]:
         """Process a given evtx file, yields a JSON representation of the data.
 
         :param evtx_file: The literal path to the evtx file.
         :type evtx_file: str
-        :yield: JSON formatted representation of an event log.
-        :rtype: Iterator[JSON]
+        :param source: An optional name to report as the source of each event, defaults to the file name.
+        :type source: str, optional
+        :param chunks: The [start, stop) range of chunks to read, or of 64 KB blocks to carve with --carve, defaults to the whole file.
+        :type chunks: Tuple[int, int], optional
+        :param wanted: A prefilter on each record's event ID and provider name, defaults to None
+        :type wanted: Callable[[str, Any], bool], optional
+        :param after: Only read records with a higher record ID, defaults to 0
+        :type after: int, optional
+        :param copies: Copies of records to skip with --carve, from log_copies, defaults to ()
+        :type copies: Collection[Tuple[int, int]], optional
+        :yield: JSON formatted representation of an event log, or None for records the prefilter skipped.
+        :rtype: Iterator[Union[JSON, None]]
+        """
+        if not os.path.exists(evtx_file):
+            return
+        if CARVE:
+            yield from carve_events(
+                evtx_file, source, *chunks, wanted, *window(), after, copies
+            )
+        else:
+            yield from iter_events(evtx_file, source, *chunks, wanted, *window(), after)
+
+    def log_chunks(event_type: str, evtx_file: str = None, after: int = 0) -> List[int]:
+        """Return which chunks of an event log to read, so that it can be read in parallel pieces.
+
+        Chunks that can only hold records from outside the --since/--until window, or from at or
+        before record ID after, are left out. With --carve the chunk layout is not trusted, so
+        every 64 KB block of the file is returned instead.
+
+        :param event_type: An event log to size.
+        :type event_type: str
+        :param evtx_file: A collected evtx file to size instead of the live log, defaults to None
+        :type evtx_file: str, optional
+        :param after: Only read records with a higher record ID, defaults to 0
+        :type after: int, optional
+        :return: The chunk indexes, empty if the log does not exist.
+        :rtype: List[int]
         """
-        if os.path.exists(evtx_file):
-            for xml_str in iter_evtx2xml(evtx_file):
-                try:
-                    yield splunkify(xml2json(xml_str), source=evtx_file)
-                except:  # noqa: E722
-                    pass
-
-    def t_dict(d: Union[List, Dict]) -> Union[Dict, List]:
-        """Given a dictionary, converts the CamelCase keys to snake_case.
-
-        :param d: A dictionary to format.
-        :type d: Union[List, Dict]
-        :return: A properly formatted dict with snake_case keys.
-        :rtype: Union[Dict,List]
-
-        Reference: `Stack Overflow <https://stackoverflow.com/questions/60148175/convert-camelcase-to-snakecase>_`
+        evtx_file = log_file(event_type, evtx_file)
+        if not os.path.exists(evtx_file):
+            return []
+        if CARVE:
+            return list(range(count_blocks(evtx_file)))
+        return window_chunks(evtx_file, *window(), after)
+
+    def log_copies(
+        event_type: str, evtx_file: str, spans: List[Tuple[int, int]]
+    ) -> List[FrozenSet[Tuple[int, int]]]:
+        """Return the copies of records to skip in each range of an event log carved with --carve.
+
+        Carving finds every copy of a chunk, so the copies are worked out over the whole log before
+        it is split between tasks. Without --carve nothing is skipped.
+
+        :param event_type: An event log.
+        :type event_type: str
+        :param evtx_file: A collected evtx file instead of the live log.
+        :type evtx_file: str
+        :param spans: The [start, stop) ranges of the log each task reads.
+        :type spans: List[Tuple[int, int]]
+        :return: The copies each task should skip, for process_files.
+        :rtype: List[FrozenSet[Tuple[int, int]]]
         """
-        if isinstance(d, list):
-            return [t_dict(i) if isinstance(i, (dict, list)) else i for i in d]
-        return {
-            _no_camels(a): t_dict(b) if isinstance(b, (dict, list)) else b
-            for a, b in d.items()
-        }
-
-    async def gather(event_type: str) -> Iterator[Dict]:
+        if not CARVE:
+            return [frozenset()] * len(spans)
+        copies = carved_copies(log_file(event_type, evtx_file), spans)
+        if any(copies):
+            logging.log(
+                EVENTS,
+                "Skipping {} copies of carved records in {}.".format(
+                    sum(map(len, copies)), log_file(event_type, evtx_file)
+                ),
+            )
+        return copies
+
+    async def gather(
+        event_type: str,
+        evtx_file: str = None,
+        chunks: Tuple[int, int] = (0, None),
+        wanted: Callable[[str, Any], bool] = None,
+        after: int = 0,
+        copies: Collection[Tuple[int, int]] = (),
+    ) -> Iterator[Union[Dict, None]]:
         """Yield or "gather" event logs given an event type. Ex: "Application" will read from Application.evtx.
 
         :param event_type: An event log to read from.
         :type event_type: str
-        :yield: Parsed and formatted eventlog data.
-        :rtype: Iterator[Dict]
+        :param evtx_file: A collected evtx file to read instead of the live log, defaults to None
+        :type evtx_file: str, optional
+        :param chunks: The [start, stop) range of chunks to read, defaults to the whole log.
+        :type chunks: Tuple[int, int], optional
+        :param wanted: A prefilter on each record's event ID and provider name, defaults to None
+        :type wanted: Callable[[str, Any], bool], optional
+        :param after: Only read records with a higher record ID, defaults to 0
+        :type after: int, optional
+        :param copies: Copies of records to skip with --carve, from log_copies, defaults to ()
+        :type copies: Collection[Tuple[int, int]], optional
+        :yield: Parsed and formatted eventlog data, or None for records the prefilter skipped.
+        :rtype: Iterator[Union[Dict, None]]
         """
-        for item in process_files(default_dir.format(event_type)):
-            yield t_dict(item)
+        if evtx_file:
+            source = os.path.relpath(evtx_file, EVTX_DIR)
+            host = corpus_host(evtx_file)
+        else:
+            evtx_file, source, host = default_dir().format(event_type), None, None
+        for item in process_files(evtx_file, source, chunks, wanted, after, copies):
+            if item and host:
+                item["event"]["fields"]["host"] = host
+            yield item
 
 
 else:
 
+    def log_chunks(*args: Any, **kwargs: Any) -> List[int]:
+        """Return a single chunk when there is an import error, so gather still gets to report it.
+
+        :return: [0]
+        :rtype: List[int]
+        """
+        return [0]
+
+    def log_copies(
+        event_type: str, evtx_file: str, spans: List[Tuple[int, int]]
+    ) -> List[FrozenSet[Tuple[int, int]]]:
+        """Return nothing to skip when there is an import error.
+
+        :return: An empty set for each span.
+        :rtype: List[FrozenSet[Tuple[int, int]]]
+        """
+        return [frozenset()] * len(spans)
+
     async def gather(*args: Any, **kwargs: Any) -> Iterator[str]:
         """Return if there is an import error. Allows us to gracefully handle import errors.str.
 
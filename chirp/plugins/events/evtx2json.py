@@ -8,6 +8,9 @@ Process file(s)
 Process folder
     evtx2json.py process_folder --folder evtx_folder
 
+Export file(s) and folder(s) in parallel to gzipped NDJSON, one output file per evtx file
+    evtx2json.py export --files samples/*.evtx --folder evtx_folder --output ndjson_out --workers 8
+
 Enable logging to Splunk
     evtx2json.py --splunk --host splunkfw.domain.tld --port 8888 --token BEA33046C-6FEC-4DC0-AC66-4326E58B54C3 \
         process_files -f samples/*.evtx
@@ -22,9 +25,13 @@ Enable logging to Splunk but disable JSON modifications
 
 # Standard Python Libraries
 import argparse
+from collections import Counter
 from glob import glob
+import gzip
+import io
 import json
 import logging
+from multiprocessing import Pool
 import os.path
 import sys
 import time
@@ -34,12 +41,30 @@ import xml.etree.ElementTree as ET  # nosec
 import Evtx.Evtx as evtx
 from xmljson import badgerfish as bf
 
+try:
+    # cisagov Libraries
+    from chirp.plugins.events.decoder import iter_events
+except ImportError:  # Run as a script, next to the decoder
+    # Third-Party Libraries
+    from decoder import iter_events
+
 logger = logging.getLogger()
 
 # Additional fields for Splunk indexing
 fields = dict({})
 
-global event_counter, error_counter
+# Export writes this many events at a time, through a buffer this large
+EXPORT_BATCH = 1000
+EXPORT_BUFFER = 1 << 20
+
+
+def new_stats(evtx_file):
+    """
+    Counters for one evtx file.  Each file gets its own, so files converted in parallel never share them.
+    :param evtx_file: file path string
+    :return: dict of per file counters
+    """
+    return {"file": evtx_file, "total_events": 0, "pass": 0, "fail": 0}
 
 
 def add_splunk_handler(args):
@@ -108,7 +133,7 @@ def remove_namespace(tree):
     :return: xml ElementTree Element with namespace removed
     """
     # Remove namespace
-    for element in tree.getiterator():
+    for element in tree.iter():
         try:
             if element.tag.startswith("{"):
                 element.tag = element.tag.split("}")[1]
@@ -134,29 +159,29 @@ def xml2json(xml_str):
         return obj
 
 
-def iter_evtx2xml(evtx_file):
+def iter_evtx2xml(evtx_file, stats=None):
     """
     Generator function to read events from evtx file and convert to xml
     :param evtx_file: file path string
+    :param stats: dict of per file counters from new_stats, counted into as events are read
     :return: generator to xml string representation of evtx event
     """
-    global error_counter, event_counter
-    error_counter = 0
-    event_counter = 0
+    if stats is None:
+        stats = new_stats(evtx_file)
     try:
         with evtx.Evtx(evtx_file) as log:
             # process each log entry and return xml representation
             for record in log.records():
-                event_counter += 1
+                stats["total_events"] += 1
                 try:
                     yield record.xml()
                 except Exception as err:
-                    error_counter += 1
-                    # logger.error("Failed to convert EVTX to XML for %s. Error count: %d" % (evtx_file, error_counter))
+                    stats["fail"] += 1
+                    # logger.error("Failed to convert EVTX to XML for %s. Error count: %d" % (evtx_file, stats["fail"]))
     except Exception as err:
         raise
-    if error_counter:
-        logging.error("Failed to read {} events.".format(error_counter))
+    if stats["fail"]:
+        logging.error("Failed to read {} events.".format(stats["fail"]))
 
 
 def _transform_system(output):
@@ -249,21 +274,11 @@ def splunkify(output, source):
     return event
 
 
-def output_stats(evtx_file, success_counter, start_time):
-    """ Log basic stats per evtx file """
-    global event_counter, error_counter
+def output_stats(stats, start_time):
+    """Log basic stats per evtx file"""
     delta_secs = int(time.time()) - start_time
 
-    logger.info(
-        {
-            "file": evtx_file,
-            "total_events": event_counter,
-            "pass": success_counter,
-            "fail": error_counter,
-            "time": start_time,
-            "elapsed_sec": delta_secs,
-        }
-    )
+    logger.info(dict(stats, time=start_time, elapsed_sec=delta_secs))
 
 
 def process_files(args):
@@ -276,25 +291,24 @@ def process_files(args):
     if args.splunk:
         add_splunk_handler(args)
 
-    global error_counter
-    start_time = int(time.time())
     for evtx_file in args.files:
         if evtx_file.endswith(".evtx"):
             logger.debug("Now processing %s" % evtx_file)
-            success_counter = 0
-            for xml_str in iter_evtx2xml(evtx_file):
+            start_time = int(time.time())
+            stats = new_stats(evtx_file)
+            for xml_str in iter_evtx2xml(evtx_file, stats):
                 try:
                     if args.disable_json_tweaks:
                         output = xml2json(xml_str)
                     else:
                         output = splunkify(xml2json(xml_str), evtx_file)
                 except Exception:
-                    error_counter += 1
+                    stats["fail"] += 1
                 else:
                     logger.info(json.loads(json.dumps(output["Event"])))
-                    success_counter += 1
+                    stats["pass"] += 1
 
-            output_stats(evtx_file, success_counter, start_time)
+            output_stats(stats, start_time)
 
 
 def process_folder(args):
@@ -303,6 +317,81 @@ def process_folder(args):
     process_files(args)
 
 
+def export_file(job):
+    """
+    Convert one evtx file to gzipped NDJSON, one JSON event per line.  Runs in a worker process.
+    Records are decoded straight from their BinXML templates by the events plugin's decoder, into the
+    same splunkify (or with disable_json_tweaks, xml2json) layout the XML round trip gives, without
+    rendering XML.  Events are serialised once, batched, and written through a large buffer.
+    :param job: tuple of (evtx file, output file, disable_json_tweaks, compresslevel)
+    :return: dict of per file stats
+    """
+    evtx_file, output_file, disable_json_tweaks, compresslevel = job
+    start_time = int(time.time())
+    stats = new_stats(evtx_file)
+    stats["output"] = output_file
+    batch = []
+    with gzip.open(
+        output_file, "wb", compresslevel=compresslevel
+    ) as gz, io.BufferedWriter(gz, buffer_size=EXPORT_BUFFER) as raw, io.TextIOWrapper(
+        raw, encoding="utf-8"
+    ) as out:
+        failed = Counter()
+        layout = "xml" if disable_json_tweaks else "splunk"
+        for event in iter_events(evtx_file, layout=layout, failed=failed):
+            batch.append(json.dumps(event))
+            stats["pass"] += 1
+            if len(batch) >= EXPORT_BATCH:
+                out.write("\n".join(batch) + "\n")
+                batch = []
+        if batch:
+            out.write("\n".join(batch) + "\n")
+    stats["fail"] = failed["records"]
+    stats["total_events"] = stats["pass"] + stats["fail"]
+    stats["bytes"] = os.path.getsize(output_file)
+    stats["time"] = start_time
+    stats["elapsed_sec"] = int(time.time()) - start_time
+    return stats
+
+
+def export(args):
+    """
+    Convert many evtx files to gzipped NDJSON in parallel, each file in its own worker process.
+    Output files are named after their evtx file, numbered when two share a name.
+    Stats for each file are logged as it finishes, followed by the totals.
+    """
+    files = [f for f in (args.files or []) if f.endswith(".evtx")]
+    for folder in args.folder or []:
+        files += sorted(glob(os.path.join(folder, "*.evtx")))
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+
+    jobs = []
+    names = set()
+    for evtx_file in files:
+        stem = os.path.splitext(os.path.basename(evtx_file))[0]
+        name, n = stem, 1
+        while name in names:
+            n += 1
+            name = "%s_%d" % (stem, n)
+        names.add(name)
+        output_file = os.path.join(args.output, name + ".ndjson.gz")
+        jobs.append(
+            (evtx_file, output_file, args.disable_json_tweaks, args.compresslevel)
+        )
+
+    start_time = int(time.time())
+    totals = {"files": 0, "total_events": 0, "pass": 0, "fail": 0, "bytes": 0}
+    with Pool(args.workers) as pool:
+        for stats in pool.imap_unordered(export_file, jobs):
+            logger.info(stats)
+            totals["files"] += 1
+            for key in ("total_events", "pass", "fail", "bytes"):
+                totals[key] += stats[key]
+    totals["elapsed_sec"] = int(time.time()) - start_time
+    logger.info(totals)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         add_help=False, description="Convert Windows evtx files to JSON"
@@ -389,7 +478,38 @@ if __name__ == "__main__":
     )
     folder_parser_group.set_defaults(func=process_folder)
 
+    # Parser for parallel export to gzipped NDJSON
+    parser_fh = subparsers.add_parser("export")
+    export_parser_group = parser_fh.add_argument_group(
+        title="Export evtx files and folders to gzipped NDJSON in parallel"
+    )
+    export_parser_group.add_argument("--files", "-f", help="evtx file", nargs="+")
+    export_parser_group.add_argument(
+        "--folder", help="Folder containing evtx files", nargs="+"
+    )
+    export_parser_group.add_argument(
+        "--output", "-o", help="Folder to write .ndjson.gz files to", required=True
+    )
+    export_parser_group.add_argument(
+        "--workers",
+        "-w",
+        help="Worker processes, defaults to one per core",
+        type=int,
+        default=None,
+    )
+    export_parser_group.add_argument(
+        "--compresslevel",
+        help="gzip compression level",
+        type=int,
+        choices=range(1, 10),
+        default=6,
+    )
+    export_parser_group.set_defaults(func=export)
+
     args = parser.parse_args()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    logger.addHandler(stream_handler)
+    logger.setLevel(logging.getLevelName(args.loglevel))
     try:
         stream_handler.setLevel(logging.getLevelName(args.loglevel))
         args.func(args)
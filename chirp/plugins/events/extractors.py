@@ -0,0 +1,225 @@
+"""Compiled field extractors for matching events indicators.
+
+A compiled operators.Predicate finds the values it compares by walking an event's
+dict: it navigates the key path, then recurses through every value beneath it.
+Events of the same shape have the same keys at every level, so that walk is done
+once per shape and key path, and kept as the paths to the values it reached.
+Matching another event of that shape is then a few indexed lookups, and every
+indicator checked against one event shares the values found, through an
+EventView of it.
+
+Many events carry byte-identical values, such as a scheduled script's block or a
+service logon's fields, so regular expression verdicts are also kept in a
+bounded LRU cache keyed by the search string and a 16 byte digest of the value
+searched, so that an entry costs the same for a long script block as a short field.
+
+With --profile or --regex-budget, the time each regular expression spends searching
+is kept too, and one that goes over its budget is flagged for the report. It is
+still searched, so a slow pattern never costs a match or turns a NOT into one.
+"""
+
+# Standard Python Libraries
+from collections import Counter, OrderedDict
+import hashlib
+from time import perf_counter
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Tuple, Union
+
+# cisagov Libraries
+from chirp.common import PROFILE, REGEX_BUDGET, VERDICT_CACHE
+from chirp.plugins import operators
+
+# Paths to the compared values, by (shape, key path). None stands for a key path that is
+# missing, which is compared as None.
+_EXTRACTORS: Dict[Tuple[Hashable, Union[Tuple, None]], List[Union[Tuple, None]]] = {}
+_MAX_EXTRACTORS = 4096
+# Regular expression verdicts, by (operand, value type, value or its digest), least recently
+# used first
+_VERDICTS: "OrderedDict[Tuple[str, type, Any], bool]" = OrderedDict()
+_COUNTS = Counter()
+# Searches by regular expression operand since the last take_profile: [seconds, searches, over budget]
+_PROFILE: Dict[str, list] = {}
+_SPENT = Counter()  # Seconds by operand, for the life of the worker
+_TIMED = bool(PROFILE or REGEX_BUDGET)
+
+
+def shape(event_log: dict) -> Union[Hashable, None]:
+    """Return the shape of an event dict, or None if the decoder did not give it one.
+
+    :param event_log: An event dict from the events plugin.
+    :type event_log: dict
+    :return: Its shape, with the fields added after decoding.
+    :rtype: Union[Hashable, None]
+    """
+    try:
+        return event_log.shape, tuple(event_log["event"]["fields"])
+    except (AttributeError, KeyError, TypeError):
+        return None
+
+
+def _walk(item: Any) -> Iterator[Tuple]:
+    """Yield the path to every value a predicate recurses down to, in the order it does."""
+    if isinstance(item, dict):
+        for k, v in item.items():
+            for rest in _walk(v):
+                yield (k,) + rest
+    else:
+        yield ()
+
+
+def _paths(event_log: dict, path: Union[Tuple, None]) -> List[Union[Tuple, None]]:
+    """Return the paths to the values a predicate compares, given the key path it drills into."""
+    if path is not None:
+        item = event_log
+        for k in path:
+            try:
+                item = item[k]
+            except KeyError:
+                return [None]
+        return [path + rest for rest in _walk(item)]
+    return list(_walk(event_log))
+
+
+def _value(event_log: dict, path: Union[Tuple, None]) -> Any:
+    """Follow a path to a value, None for a missing key path."""
+    if path is None:
+        return None
+    for k in path:
+        event_log = event_log[k]
+    return event_log
+
+
+def cache_counts() -> Tuple[int, int]:
+    """Return how many verdicts this process has found in the verdict cache, and how many it has not.
+
+    :return: The (hits, misses) so far.
+    :rtype: Tuple[int, int]
+    """
+    return _COUNTS["hits"], _COUNTS["misses"]
+
+
+def _verdict(predicate: operators.Predicate, value: Any) -> bool:
+    """Compare a value, reusing the verdict for a value a regular expression already searched."""
+    if predicate.pattern is None or not VERDICT_CACHE:
+        return predicate.test(value)
+    # The type is part of the key, since values like 1 and True are equal but search differently
+    if value.__class__ is str or value.__class__ is bytes:
+        # Keyed by a digest, so the cache never holds the text of the values it has seen
+        data = value.encode("utf-8", "surrogatepass") if value.__class__ is str else value
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        key = (predicate.operand, value.__class__, digest)
+    else:
+        key = (predicate.operand, value.__class__, value)
+    try:
+        verdict = _VERDICTS[key]
+    except KeyError:
+        _COUNTS["misses"] += 1
+        verdict = _VERDICTS[key] = predicate.test(value)
+        if len(_VERDICTS) > VERDICT_CACHE:
+            _VERDICTS.popitem(last=False)
+        return verdict
+    except TypeError:  # Unhashable values are searched every time
+        return predicate.test(value)
+    _COUNTS["hits"] += 1
+    _VERDICTS.move_to_end(key)
+    return verdict
+
+
+class EventView(operators.Record):
+    """A record view of an event, that finds values through the compiled extractor of its shape.
+
+    :param event_log: The event dict to view.
+    :type event_log: dict
+    :param event_shape: The event's shape, defaults to None which takes it from the event.
+    :type event_shape: Hashable, optional
+    """
+
+    __slots__ = ("shape",)
+
+    def __init__(self, event_log: dict, event_shape: Hashable = None) -> None:
+        """View an event, nothing is read from it until a predicate asks."""
+        super().__init__(event_log)
+        self.shape = shape(event_log) if event_shape is None else event_shape
+
+    def _resolve(self, path: Union[Tuple[str, ...], None]) -> Tuple[Any, ...]:
+        """Find the values at a key path, through the extractor of the event's shape."""
+        if self.shape is None:
+            return super()._resolve(path)
+        try:
+            paths = _EXTRACTORS[(self.shape, path)]
+        except KeyError:
+            if len(_EXTRACTORS) >= _MAX_EXTRACTORS:
+                _EXTRACTORS.clear()
+            paths = _EXTRACTORS[(self.shape, path)] = _paths(self.item, path)
+        return tuple(_value(self.item, p) for p in paths)
+
+
+def take_profile() -> Dict[str, list]:
+    """Return the time each regular expression spent searching since the last call, and start again.
+
+    :return: {operand: [seconds, searches, whether it went over --regex-budget]}
+    :rtype: Dict[str, list]
+    """
+    global _PROFILE
+    profile, _PROFILE = _PROFILE, {}
+    return profile
+
+
+def _timed(
+    predicate: operators.Predicate, search: Callable[[], Any], searches: int = 1
+) -> Any:
+    """Run a regular expression's search, charging the time to it and flagging it once over budget."""
+    operand = predicate.operand
+    started = perf_counter()
+    verdict = search()
+    spent = perf_counter() - started
+    entry = _PROFILE.setdefault(operand, [0.0, 0, False])
+    entry[0] += spent
+    entry[1] += searches
+    _SPENT[operand] += spent
+    if REGEX_BUDGET and _SPENT[operand] > REGEX_BUDGET:
+        entry[2] = True
+    return verdict
+
+
+def search(predicate: Union[operators.Predicate, None], view: operators.Record) -> bool:
+    """Search an event with a compiled predicate, through the view every predicate checked against it shares.
+
+    :param predicate: The compiled search string and key, None for one that can't be parsed.
+    :type predicate: Union[operators.Predicate, None]
+    :param view: A view of the event to search, an EventView for events from the decoder.
+    :type view: operators.Record
+    :return: Whether the event matches.
+    :rtype: bool
+    """
+    if predicate is None:
+        return False
+    if _TIMED and predicate.pattern is not None:
+        return bool(_timed(predicate, lambda: predicate.search(view, _verdict)))
+    return predicate.search(view, _verdict)
+
+
+def search_block(
+    predicate: Union[operators.Predicate, None],
+    views: List[operators.Record],
+    mask: int,
+) -> int:
+    """Search a block of events with a compiled predicate at once.
+
+    :param predicate: The compiled search string and key, None for one that can't be parsed.
+    :type predicate: Union[operators.Predicate, None]
+    :param views: Views of the events, EventViews for events from the decoder.
+    :type views: List[operators.Record]
+    :param mask: A bitmap of the events to search.
+    :type mask: int
+    :return: A bitmap of the events that match.
+    :rtype: int
+    """
+    if predicate is None:
+        return 0
+    if _TIMED and predicate.pattern is not None:
+        return _timed(
+            predicate,
+            lambda: predicate.search_block(views, mask, _verdict),
+            bin(mask).count("1"),
+        )
+    return predicate.search_block(views, mask, _verdict)
@@ -1,107 +1,566 @@
 """Main method for the Windows events plugin."""
 
 # Standard Python Libraries
+from contextlib import closing, nullcontext
+from itertools import islice
 import json
 import logging
 import os
-from typing import Dict, List, Tuple, Union
+from typing import Any, Callable, Dict, FrozenSet, List, Set, Tuple, Union
 
 # Third-Party Libraries
 import aiomultiprocess as aiomp
 
 # cisagov Libraries
-from chirp.common import EVENTS, OUTPUT_DIR, build_report
+from chirp.common import (
+    CHECKPOINT,
+    EVENT_STORE,
+    EVENTS,
+    EVTX_DIR,
+    FROM_STORE,
+    MAX_MATCHES,
+    OUTPUT_DIR,
+    PROFILE,
+    REGEX_BUDGET,
+    SHARED_EVENTS,
+    SINCE,
+    UNTIL,
+    build_report,
+    setup_logging,
+)
 from chirp.plugins import operators
-from chirp.plugins.events.events import gather
+from chirp.plugins.events import checkpoint, extractors, store
+from chirp.plugins.events.events import (
+    corpus_logs,
+    default_dir,
+    gather,
+    log_chunks,
+    log_copies,
+    log_file,
+)
+
+# 32 chunks of 64 KB each, about 2 MB of log per task
+CHUNKS_PER_TASK = 32
+# Events are matched against the indicators in blocks of this many
+BLOCK_SIZE = 1024
 
 
 async def check_matches(
     indicator_list: List[Tuple[str, str]],
     event_id: Union[int, None],
     event_log: dict,
+    view: extractors.EventView = None,
+    expression: operators.Expression = None,
 ) -> Tuple[int, List[Dict[str, str]], Union[str, dict]]:
     """Check for indicator matches in an event log.
 
+    The indicator's condition is evaluated with short-circuiting, so the event is decided as soon
+    as one criterion settles it.
+
     :param indicator_list: A list containing tuples of keys and search strings.
     :type indicator_list: List[Tuple[str, str]]
     :param event_id: An event ID to query.
     :type event_id: Union[int, None]
     :param event_log: An event log being queried, represented as a dict.
     :type event_log: dict
+    :param view: The view of event_log that every indicator checked against it shares, defaults to None which makes one.
+    :type view: extractors.EventView, optional
+    :param expression: The indicator compiled by operators.compile_expression, defaults to None which compiles it, once, with no condition.
+    :type expression: operators.Expression, optional
     :return: A tuple of (hits, the search criteria, matches)
     :rtype: Tuple[int, List[Dict[str, str]], Union[str, dict]]
     """
-    hits = 0
-    search_criteria = []
     match = ""
-    for key, search_string in indicator_list:
-        _match = None
-        if not match:
-            if operators.searcher(search_string, event_log, key.lower()):
-                _match = event_log
+    if expression is None:
+        expression = operators.indicator_expression(indicator_list)
+    if view is None:
+        view = extractors.EventView(event_log)
+    if expression.evaluate(view, extractors.search):
+        match = event_log
+    search_criteria = [
+        {
+            "key": str(key),
+            "search_string": search_string,
+            "event_id": event_id,
+        }
+        for key, search_string in indicator_list
+    ]
+    return len(indicator_list), search_criteria, match
+
+
+def index_indicators(
+    indicators: List[dict],
+) -> Dict[
+    str, Dict[Union[str, None], List[Tuple[str, Any, List[Tuple[str, str]], Any]]]
+]:
+    """Index events indicators by the log they read and the event ID they look for.
+
+    Indicators without an event ID go in the None bucket, which applies to every event in that log.
+
+    :param indicators: A list containing parsed events indicators.
+    :type indicators: List[dict]
+    :return: {event_type: {event_id: [(indicator name, event ID, [(key, search string), ...], condition), ...]}}
+    :rtype: Dict[str, Dict[Union[str, None], List[Tuple[str, Any, List[Tuple[str, str]], Any]]]]
+    """
+    index = {}
+    for indicator in indicators:
+        ind = indicator["indicator"]
+        event_id = ind.get("event_id")
+        indicator_list = [
+            (k, v)
+            for k, v in ind.items()
+            if k not in ["event_type", "event_id", "condition"]
+        ]
+        index.setdefault(ind["event_type"], {}).setdefault(
+            None if event_id is None else str(event_id), []
+        ).append((indicator["name"], event_id, indicator_list, ind.get("condition")))
+    return index
+
+
+def _providers(
+    indicator_list: List[Tuple[str, str]], expression: operators.Expression
+) -> Union[Set[Any], None]:
+    """Return the provider names an indicator is limited to, or None if it could match any provider.
+
+    Each provider name equality limits its criterion to that provider, and the indicator's
+    condition combines those limits.
+    """
+
+    def bound(criterion: int, _: Any) -> Union[Set[Any], None]:
+        key, search_string = indicator_list[criterion]
+        if key.lower() != "event.system.provider.name" or not str(
+            search_string
+        ).startswith("== "):
+            return None
+        return {operators.parse_operator_and_operand(search_string)[1]}
+
+    return expression.narrow(bound)
+
+
+def prefilter(
+    index: Dict[Union[str, None], List[Tuple[str, Any, List[Tuple[str, str]]]]],
+) -> Callable[[str, Any], bool]:
+    """Build a check that turns away records no indexed indicator can match, from header fields alone.
+
+    Records outside --since/--until are already left out by the decoder, on their record headers.
+
+    :param index: The indicators for one log, keyed by event ID as built by index_indicators.
+    :type index: Dict[Union[str, None], List[Tuple[str, Any, List[Tuple[str, str]]]]]
+    :return: A callable taking a record's event ID and provider name.
+    :rtype: Callable[[str, Any], bool]
+    """
+    allowed = {}  # event ID: provider names, or None for any provider
+    for event_id, bucket in index.items():
+        providers = set()
+        for _, _, indicator_list, expression in bucket:
+            names = _providers(indicator_list, expression)
+            if names is None:
+                providers = None
+                break
+            providers |= names
+        allowed[event_id] = providers
+    wildcard = allowed.pop(None, set())
+
+    def wanted(event_id: str, provider: Any) -> bool:
+        for providers in (allowed.get(event_id, set()), wildcard):
+            if providers is None or provider in providers:
+                return True
+        return False
+
+    return wanted
+
+
+def _event_id(event_log: dict) -> Union[str, None]:
+    """Return the event ID of an event log as a string, whether or not it kept its Qualifiers attribute."""
+    try:
+        event_id = event_log["event"]["system"]["event_id"]
+    except (KeyError, TypeError):
+        return None
+    if isinstance(event_id, dict):
+        event_id = event_id.get("$")
+    return str(event_id)
+
+
+def _ref(event_log: dict, fallback: Tuple) -> Tuple:
+    """Return a key that names an event log across every task, its source and record ID.
+
+    A carved record also carries its offset, since the logs carved from one image can reuse record IDs.
+    """
+    fields = event_log["event"].get("fields", {})
+    try:
+        record_id = event_log["event"]["system"]["event_record_id"]
+    except (KeyError, TypeError):
+        return (fields.get("source"),) + fallback
+    if "offset" in fields:
+        return fields.get("source"), record_id, fields["offset"]
+    return fields.get("source"), record_id
+
+
+def _seen(event_log: dict) -> Union[str, None]:
+    """Return when an event was logged, as the SystemTime string it carries."""
+    try:
+        return str(event_log["event"]["system"]["time_created"]["system_time"])
+    except (KeyError, TypeError):
+        return None
+
+
+def _tally(entry: dict, count: int, first_seen: Any, last_seen: Any) -> None:
+    """Add matches to an indicator's count and first/last seen times."""
+    entry["count"] += count
+    for key, seen, pick in (
+        ("first_seen", first_seen, min),
+        ("last_seen", last_seen, max),
+    ):
+        if seen is not None:
+            entry[key] = seen if entry[key] is None else pick(entry[key], seen)
+
+
+def _keep(
+    tallies: Dict[int, list],
+    samples: List[Tuple[int, Tuple]],
+    events: Dict[Tuple, str],
+    indicator_id: int,
+    match: dict,
+    fallback: Tuple,
+) -> None:
+    """Count a task's match for an indicator, and keep it as a sample while under MAX_MATCHES."""
+    seen = _seen(match)
+    tally = tallies.setdefault(indicator_id, [0, seen, seen])
+    tally[0] += 1
+    if seen is not None:
+        tally[1] = seen if tally[1] is None else min(tally[1], seen)
+        tally[2] = seen if tally[2] is None else max(tally[2], seen)
+    if not MAX_MATCHES or tally[0] <= MAX_MATCHES:
+        ref = _ref(match, fallback)
+        if ref not in events:
+            events[ref] = json.dumps(match)
+        samples.append((indicator_id, ref))
+
+
+def _keep_block(
+    tallies: Dict[int, list],
+    samples: List[Tuple[int, Tuple]],
+    events: Dict[Tuple, str],
+    indicator_id: int,
+    expression: operators.Expression,
+    views: List[extractors.EventView],
+    fallbacks: List[Tuple],
+    search_block: Callable[
+        [Union[operators.Predicate, None], List[operators.Record], int], int
+    ] = extractors.search_block,
+    mask: int = None,
+) -> None:
+    """Evaluate an indicator over a block of events at once, and keep each match in order."""
+    matched = expression.evaluate_block(views, search_block, mask)
+    for i in operators.bits(matched):
+        _keep(tallies, samples, events, indicator_id, views[i].item, fallbacks[i])
+
+
+def _match_block(
+    index: Dict[Union[str, None], list],
+    block: List[Tuple[extractors.EventView, Union[str, None], Tuple]],
+    tallies: Dict[int, list],
+    samples: List[Tuple[int, Tuple]],
+    events: Dict[Tuple, str],
+) -> int:
+    """Match a block of a log's events against the indicators for that log.
+
+    Each indicator only sees the events of the block with its event ID, or every event if it
+    has none, so an event is checked against the same indicators as it would be alone. A
+    predicate that several indicators share searches each event once, for all of them.
+
+    :param index: The compiled indicators for the log, keyed by event ID.
+    :type index: Dict[Union[str, None], list]
+    :param block: (view, event ID, fallback ref) for each event, in log order.
+    :type block: List[Tuple[extractors.EventView, Union[str, None], Tuple]]
+    :return: How many searches sharing predicates saved.
+    :rtype: int
+    """
+    views = [view for view, _, _ in block]
+    fallbacks = [fallback for _, _, fallback in block]
+    masks = {None: (1 << len(block)) - 1}
+    for i, (_, event_id, _) in enumerate(block):
+        masks[event_id] = masks.get(event_id, 0) | 1 << i
+    shared = operators.SharedSearch(extractors.search_block)
+    for event_id, bucket in index.items():
+        mask = masks.get(event_id)
+        if not mask:
+            continue
+        for indicator_id, _, _, expression in bucket:
+            _keep_block(
+                tallies,
+                samples,
+                events,
+                indicator_id,
+                expression,
+                views,
+                fallbacks,
+                shared,
+                mask,
+            )
+    return shared.saved
+
+
+def compile_plan(
+    index: Dict[str, Dict[Union[str, None], list]],
+) -> Tuple[Dict[str, Dict[Union[str, None], list]], List[Tuple[str, list]]]:
+    """Give each indicator of an index an ID, so workers can report matches by that ID alone.
+
+    Each indicator's search strings and condition are compiled here too, once for the whole run,
+    and a predicate that several indicators have in common is compiled into one they all share.
+
+    :param index: Indicators as built by index_indicators.
+    :type index: Dict[str, Dict[Union[str, None], list]]
+    :return: The index with each name swapped for an indicator ID and its condition compiled, and the (name, search criteria) of each ID.
+    :rtype: Tuple[Dict[str, Dict[Union[str, None], list]], List[Tuple[str, list]]]
+    """
+    plan, described, unique = {}, [], {}
+    for event_type, buckets in index.items():
+        for event_id_key, bucket in buckets.items():
+            for name, event_id, indicator_list, condition in bucket:
+                expression = operators.compile_expression(indicator_list, condition)
+                expression.share(unique)
+                plan.setdefault(event_type, {}).setdefault(event_id_key, []).append(
+                    (len(described), event_id, indicator_list, expression)
+                )
+                criteria = [
+                    {"key": str(k), "search_string": v, "event_id": event_id}
+                    for k, v in indicator_list
+                ]
+                described.append((name, criteria))
+    return plan, described
+
+
+def _merge(
+    report: dict,
+    events: dict,
+    described: List[Tuple[str, list]],
+    tallies: Dict[int, list],
+    samples: List[Tuple[int, Tuple]],
+    task_events: Dict[Tuple, str],
+) -> None:
+    """Assemble a task's match records into the report, keeping at most MAX_MATCHES samples each.
+
+    Samples are references into events, so an event that several indicators matched is held once.
+    """
+    for indicator_id, (count, first_seen, last_seen) in tallies.items():
+        name, criteria = described[indicator_id]
+        report[name]["_search_criteria"] = criteria
+        _tally(report[name], count, first_seen, last_seen)
+    for indicator_id, ref in samples:
+        kept = report[described[indicator_id][0]]["matches"]
+        if not MAX_MATCHES or len(kept) < MAX_MATCHES:
+            kept.append(ref)
+            events.setdefault(ref, task_events[ref])
+
+
+def _spans(chunks: List[int]) -> List[Tuple[int, int]]:
+    """Split a log's chunks into [start, stop) ranges of at most CHUNKS_PER_TASK consecutive chunks."""
+    spans = []
+    for chunk in chunks:
+        if spans and spans[-1][1] == chunk and chunk - spans[-1][0] < CHUNKS_PER_TASK:
+            spans[-1] = (spans[-1][0], chunk + 1)
         else:
-            if operators.searcher(search_string, match, key.lower()):
-                _match = match
-        hits += 1
-        search_criteria.append(
-            {
-                "key": str(key),
-                "search_string": search_string,
-                "event_id": event_id,
-            }
-        )
-        if _match:
-            match = _match
-    return hits, search_criteria, match
+            spans.append((chunk, chunk + 1))
+    return spans
+
+
+_PLAN = {}
 
 
-num_logs = 0
+def _init(plan: Dict[str, Dict[Union[str, None], list]]) -> None:
+    """Keep the compiled indicator plan in a pool worker, so that tasks do not carry it."""
+    global _PLAN
+    setup_logging()
+    _PLAN = plan
 
 
-async def _run(run_args):
-    """Gather events and check for matches."""
+async def _run(
+    run_args: Tuple[
+        str, Union[str, None], Tuple[int, int], bool, int, FrozenSet[Tuple[int, int]]
+    ],
+) -> Tuple[
+    int,
+    Dict[int, list],
+    List[Tuple[int, Tuple]],
+    Dict[Tuple, str],
+    Tuple[int, int],
+    Dict[str, list],
+    int,
+]:
+    """Gather events and check for matches.
+
+    Only compact match records go back to the parent: the number of records read, a
+    [count, first seen, last seen] tally per indicator ID, (indicator ID, event ref) samples,
+    each sampled event once, serialised, the task's verdict cache (hits, misses), the
+    time its regular expressions spent searching while profiling, and the searches that
+    sharing predicates saved.
+    """
     (
         event_type,
-        indicators,
-        report,
-        num_logs,
+        evtx_file,
+        chunks,
+        first,
+        after,
+        copies,
     ) = run_args  # Unpack our arguments (bundled to passthrough for multiprocessing)
-    logging.log(EVENTS, "Reading {} event logs.".format(event_type.split("%4")[-1]))
-    async for event_log in gather(event_type):  # Iterate over event logs
-        if event_log == "ERROR":
-            logging.log(EVENTS, "Hit an error, exiting.")
-            return
-        if event_log:
+    if first:  # Only the first piece of a log announces it
+        if evtx_file:
+            logging.log(EVENTS, "Reading {}.".format(evtx_file))
+        else:
+            logging.log(
+                EVENTS, "Reading {} event logs.".format(event_type.split("%4")[-1])
+            )
+    index = _PLAN[event_type]
+    num_logs, tallies, samples, events, block, saved = 0, {}, [], {}, [], 0
+    cached = extractors.cache_counts()
+    extractors.take_profile()  # Only this task's searches are reported
+    if EVENT_STORE:
+        # Every record goes in the store, so later indicators can be hunted for too
+        path = log_file(event_type, evtx_file) or event_type
+        keep = store.Shard(store.shard_path(EVENT_STORE, path, after, chunks))
+    else:
+        keep = nullcontext()
+    with keep as shard:
+        async for event_log in gather(
+            event_type,
+            evtx_file,
+            chunks,
+            None if shard else prefilter(index),
+            after,
+            copies,
+        ):  # Iterate over event logs
+            if event_log == "ERROR":
+                logging.log(EVENTS, "Hit an error, exiting.")
+                break
             num_logs += 1
-            for indicator in indicators:
-                ind = indicator["indicator"]
-                if (
-                    ind["event_type"] == event_type
-                ):  # Make sure the ioc is intended for this log
-                    if "event_id" in ind and str(
-                        event_log["event"]["system"]["event_id"]["$"]
-                    ) != str(
-                        ind["event_id"]
-                    ):  # If ioc looks for event_id, but there is a mismatch then skip
-                        continue
-                    elif "event_id" not in ind:
-                        ind["event_id"] = None
-                    indicator_list = [
-                        (k, v)
-                        for k, v in ind.items()
-                        if k not in ["event_type", "event_id"]
-                    ]
-                    hits, search_criteria, match = await check_matches(
-                        indicator_list, ind["event_id"], event_log
-                    )  # Check to see if the indicator matches the event log
-                    if hits != len(indicator_list):
-                        continue
-                    report[indicator["name"]]["_search_criteria"] = search_criteria
-                    if match:
-                        report[indicator["name"]]["matches"].append(
-                            match
-                        )  # Append to report because there is a match.
-    return report, num_logs
+            if not event_log:  # Records the prefilter turned away come through as None
+                continue
+            event_log_id = _event_id(event_log)
+            if shard:
+                shard.add(event_type, event_log_id, _seen(event_log), event_log)
+            block.append(
+                (extractors.EventView(event_log), event_log_id, (chunks[0], num_logs))
+            )
+            if len(block) >= BLOCK_SIZE:
+                saved += _match_block(index, block, tallies, samples, events)
+                block = []
+        saved += _match_block(index, block, tallies, samples, events)
+    cached = tuple(n - m for n, m in zip(extractors.cache_counts(), cached))
+    return num_logs, tallies, samples, events, cached, extractors.take_profile(), saved
+
+
+async def _run_store(
+    path: str,
+) -> Tuple[
+    int,
+    Dict[int, list],
+    List[Tuple[int, Tuple]],
+    Dict[Tuple, str],
+    Tuple[int, int],
+    Dict[str, list],
+    int,
+]:
+    """Check for matches among the events kept in a shard of the event store.
+
+    The inverted index narrows each indicator down to the events that hold every trigram its
+    search strings require, and only those are loaded and checked. The same compact match
+    records as _run go back to the parent.
+    """
+    since, until = (
+        point.strftime("%Y-%m-%d %H:%M:%S") if point else None
+        for point in (SINCE, UNTIL)
+    )
+    num_logs, tallies, samples, events = 0, {}, [], {}
+    cached = extractors.cache_counts()
+    extractors.take_profile()  # Only this task's searches are reported
+    with closing(store.connect(path)) as db:
+        for event_type, index in _PLAN.items():
+            num_logs += store.count(db, event_type)
+            for event_id_key, bucket in index.items():
+                for indicator_id, _, indicator_list, expression in bucket:
+                    rows = store.read(
+                        db,
+                        event_type,
+                        event_id_key,
+                        store.candidates(db, indicator_list, expression),
+                        since,
+                        until,
+                    )
+                    block = list(islice(rows, BLOCK_SIZE))
+                    while block:
+                        _keep_block(
+                            tallies,
+                            samples,
+                            events,
+                            indicator_id,
+                            expression,
+                            [extractors.EventView(event_log) for _, event_log in block],
+                            [(os.path.basename(path), row) for row, _ in block],
+                        )
+                        block = list(islice(rows, BLOCK_SIZE))
+    cached = tuple(n - m for n, m in zip(extractors.cache_counts(), cached))
+    return num_logs, tallies, samples, events, cached, extractors.take_profile(), 0
+
+
+def _report_sharing(plan: Dict[str, Dict[Union[str, None], list]]) -> None:
+    """Log how many unique predicates the criteria of a plan were compiled into.
+
+    Only predicates shared within a log are searched once for several indicators, as the
+    events of different logs are matched apart.
+    """
+    criteria, unique, within = 0, set(), 0
+    for buckets in plan.values():
+        found = [
+            predicate
+            for bucket in buckets.values()
+            for _, _, _, expression in bucket
+            for predicate in expression.predicates()
+        ]
+        criteria += len(found)
+        unique.update(map(id, found))
+        within += len(found) - len(set(map(id, found)))
+    logging.log(
+        EVENTS,
+        "Compiled {} criteria into {} unique predicates, {} repeats within a log are searched once.".format(
+            criteria, len(unique), within
+        ),
+    )
+
+
+def _report_profile(
+    plan: Dict[str, Dict[Union[str, None], list]],
+    described: List[Tuple[str, list]],
+    profile: Dict[str, list],
+) -> None:
+    """Log the regular expressions that spent the most time searching, and those that went over budget."""
+    names = {}
+    for buckets in plan.values():
+        for bucket in buckets.values():
+            for indicator_id, _, _, expression in bucket:
+                for predicate in expression.predicates():
+                    if predicate.pattern is not None:
+                        names.setdefault(predicate.operand, set()).add(
+                            described[indicator_id][0]
+                        )
+    ranked = sorted(profile.items(), key=lambda item: item[1][0], reverse=True)
+    for operand, (spent, searches, _) in ranked[:10]:
+        if not PROFILE:
+            break
+        logging.log(
+            EVENTS,
+            "Profile: {:.3f}s in {} searches for '~= {}' ({}).".format(
+                spent, searches, operand, ", ".join(sorted(names.get(operand, ())))
+            ),
+        )
+    for operand, (_, _, over) in ranked:
+        if over:
+            logging.log(
+                EVENTS,
+                "'~= {}' ({}) went over its {}s --regex-budget in a worker.".format(
+                    operand, ", ".join(sorted(names.get(operand, ()))), REGEX_BUDGET
+                ),
+            )
 
 
 async def run(indicators: dict) -> None:
@@ -115,28 +574,118 @@ async def run(indicators: dict) -> None:
     hits = 0
     num_logs = 0
     logging.debug("Entered events plugin.")
-    event_types = {indicator["indicator"]["event_type"] for indicator in indicators}
-    report = {indicator["name"]: build_report(indicator) for indicator in indicators}
-    run_args = [
-        (event_type, indicators, report, num_logs) for event_type in event_types
-    ]
-    async with aiomp.Pool() as pool:
+    index = index_indicators(indicators)
+    plan, described = compile_plan(index)
+    _report_sharing(plan)
+    report = {
+        indicator["name"]: dict(
+            build_report(indicator), count=0, first_seen=None, last_seen=None
+        )
+        for indicator in indicators
+    }
+    events = {}
+    marks, checkpoints = {}, {}
+    if FROM_STORE:
+        if not EVENT_STORE:
+            logging.error("--from-store needs an --event-store to hunt through.")
+            return
+        # Every shard holds events of any log, and is searched for every indicator
+        run_args, worker = store.shards(EVENT_STORE), _run_store
+        logging.log(
+            EVENTS,
+            "Found {} event store shards under {}.".format(len(run_args), EVENT_STORE),
+        )
+    else:
+        if EVTX_DIR:
+            # Fan every collected file out to the pool so a whole corpus is read at once
+            logs = [
+                (event_type, evtx_file)
+                for event_type in index
+                for evtx_file in corpus_logs(event_type)
+            ]
+            logging.log(
+                EVENTS, "Found {} event logs under {}.".format(len(logs), EVTX_DIR)
+            )
+        else:
+            if not default_dir():
+                return
+            logs = [(event_type, None) for event_type in index]
+        # With --checkpoint, each log is only read past the newest record the last run saw
+        checkpoints = checkpoint.load() if CHECKPOINT else {}
+        resumed = []
+        for event_type, evtx_file in logs:
+            path, after = log_file(event_type, evtx_file), 0
+            if CHECKPOINT and path and os.path.exists(path):
+                digest = checkpoint.digest(index[event_type])
+                marks[os.path.abspath(path)] = checkpoint.mark(path, digest)
+                after = checkpoint.resume(checkpoints, path, digest)
+            if EVENT_STORE and not after:
+                # A log read from the start replaces everything stored from it before
+                store.clear(EVENT_STORE, path or event_type)
+            resumed.append((event_type, evtx_file, after))
+        # Chunks are independent, so large logs are split across the pool as well. Results
+        # come back in task order, which keeps each indicator's matches in log order. The
+        # plan is sent to each worker once, so a task is only its log and chunk range.
+        run_args = []
+        for event_type, evtx_file, after in resumed:
+            spans = _spans(log_chunks(event_type, evtx_file, after))
+            copies = log_copies(event_type, evtx_file, spans)
+            run_args.extend(
+                (event_type, evtx_file, chunks, not i, after, copies[i])
+                for i, chunks in enumerate(spans)
+            )
+        worker = _run
+    interrupted = False
+    cached, profile, saved = [0, 0], {}, 0
+    async with aiomp.Pool(initializer=_init, initargs=(plan,)) as pool:
         try:
-            async for i in pool.map(_run, tuple(run_args)):
-                _rep = i[0]
-                num_logs += i[1]
-                for k, v in _rep.items():
-                    try:
-                        report[k]["_search_criteria"] = v["_search_criteria"]
-                    except KeyError:
-                        pass
-                    report[k]["matches"] += v["matches"]
+            async for i in pool.map(worker, tuple(run_args)):
+                num_logs += i[0]
+                _merge(report, events, described, *i[1:4])
+                cached = [n + m for n, m in zip(cached, i[4])]
+                saved += i[6]
+                for operand, (spent, searches, over) in i[5].items():
+                    entry = profile.setdefault(operand, [0.0, 0, False])
+                    entry[0] += spent
+                    entry[1] += searches
+                    entry[2] |= over
         except KeyboardInterrupt:
-            pass
+            interrupted = True
 
-    hits = sum(len(v["matches"]) for _, v in report.items())
+    if CHECKPOINT and not interrupted and not FROM_STORE:
+        if UNTIL:
+            # Records past --until were skipped, so moving the checkpoint up would lose them
+            logging.log(EVENTS, "Not updating checkpoints, --until was given.")
+        else:
+            checkpoints.update({k: v for k, v in marks.items() if v})
+            checkpoint.save(checkpoints)
+
+    hits = sum(v["count"] for _, v in report.items())
     logging.log(EVENTS, "Read {} logs, found {} matches.".format(num_logs, hits))
-    with open(os.path.join(OUTPUT_DIR, "events.json"), "w+") as writeout:
-        writeout.write(
-            json.dumps({r: report[r] for r in report if report[r]["matches"]})
+    if sum(cached):
+        logging.log(
+            EVENTS,
+            "Verdict cache: {} hits, {} misses ({:.0%} hit rate).".format(
+                *cached, cached[0] / sum(cached)
+            ),
         )
+    _report_profile(plan, described, profile)
+    if saved:
+        logging.log(EVENTS, "Shared predicates saved {} searches.".format(saved))
+    found = {r: report[r] for r in report if report[r]["count"]}
+    if SHARED_EVENTS:
+        # Each event is written once, and an indicator lists the positions of its matches
+        table = {}
+        for entry in found.values():
+            entry["matches"] = [
+                table.setdefault(ref, len(table)) for ref in entry["matches"]
+            ]
+        found = {
+            "events": [json.loads(events[ref]) for ref in table],
+            "indicators": found,
+        }
+    else:
+        for entry in found.values():
+            entry["matches"] = [json.loads(events[ref]) for ref in entry["matches"]]
+    with open(os.path.join(OUTPUT_DIR, "events.json"), "w+") as writeout:
+        writeout.write(json.dumps(found))
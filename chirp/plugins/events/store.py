@@ -0,0 +1,300 @@
+"""An on-disk store of parsed events, indexed for retro-hunting with new indicators.
+
+Each pool task that reads a piece of a log writes the events it parsed to its own
+SQLite shard under the store directory, so workers never contend for one file.
+Alongside each event's JSON a shard keeps its channel, event ID and time, and an
+inverted index of the lowercased trigrams of every event_data value. Indicators
+are later evaluated against the store by looking up the trigrams their search
+strings require, and only the candidate records that contain all of them are
+loaded and checked with the real operators.
+"""
+
+# Standard Python Libraries
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from typing import Any, Iterator, List, Set, Tuple, Union
+
+# cisagov Libraries
+from chirp.plugins import operators
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY, channel TEXT, event_id TEXT, time TEXT, body TEXT
+);
+CREATE TABLE IF NOT EXISTS grams (
+    gram TEXT, event INTEGER, PRIMARY KEY (gram, event)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_channel ON events (channel, event_id);
+"""
+# A candidate lookup intersects at most this many trigrams, any of them narrow it soundly
+_MAX_GRAMS = 16
+_BATCH = 500
+
+
+def _log_key(log: str) -> str:
+    """Return the prefix every shard of a log is named with."""
+    return hashlib.sha1(os.path.abspath(log).encode("utf-8")).hexdigest()[:12]
+
+
+def shard_path(root: str, log: str, after: int, chunks: Tuple[int, Any]) -> str:
+    """Return the shard a task writes the events of a piece of a log to.
+
+    :param root: The store directory.
+    :type root: str
+    :param log: The path of the log being read, or its event type for a live log without one.
+    :type log: str
+    :param after: The record ID the read resumes after.
+    :type after: int
+    :param chunks: The [start, stop) range of chunks being read.
+    :type chunks: Tuple[int, Any]
+    :return: The path of the shard, which sorts after the earlier pieces of the log.
+    :rtype: str
+    """
+    return os.path.join(
+        root, "{}-{:020d}-{:08d}.db".format(_log_key(log), after, chunks[0])
+    )
+
+
+def clear(root: str, log: str) -> None:
+    """Remove every shard of a log, before it is read again from the start.
+
+    :param root: The store directory.
+    :type root: str
+    :param log: The path of the log, or its event type.
+    :type log: str
+    """
+    for path in glob.glob(os.path.join(root, "{}-*.db".format(_log_key(log)))):
+        os.remove(path)
+
+
+def shards(root: str) -> List[str]:
+    """Return every complete shard in the store.
+
+    :param root: The store directory.
+    :type root: str
+    :return: Paths to the shards.
+    :rtype: List[str]
+    """
+    return sorted(glob.glob(os.path.join(root, "*.db")))
+
+
+def _grams(text: str) -> Set[str]:
+    """Return the lowercased trigrams of a string."""
+    text = text.lower()
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class Shard:
+    """Writes events to a new shard, which only takes the place of any old one once it is complete.
+
+    :param path: The path of the shard, from shard_path.
+    :type path: str
+    """
+
+    def __init__(self, path: str) -> None:
+        """Start writing to a partial shard next to path."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.partial = path + ".partial"
+        if os.path.exists(self.partial):
+            os.remove(self.partial)
+        self.db = sqlite3.connect(self.partial)
+        self.db.executescript(_SCHEMA)
+        self.count = 0
+        self.rows = []
+        self.grams = []
+
+    def add(
+        self,
+        channel: str,
+        event_id: Union[str, None],
+        time: Union[str, None],
+        event_log: dict,
+    ) -> None:
+        """Add an event, read from a channel.
+
+        :param channel: The event type (log name) it was read from.
+        :type channel: str
+        :param event_id: Its event ID, as a string.
+        :type event_id: Union[str, None]
+        :param time: Its SystemTime string.
+        :type time: Union[str, None]
+        :param event_log: The event dict.
+        :type event_log: dict
+        """
+        self.count += 1
+        self.rows.append((self.count, channel, event_id, time, json.dumps(event_log)))
+        found = set()
+        for value in operators.leaves(event_log["event"].get("event_data")):
+            found |= _grams(str(value))
+        self.grams.extend((gram, self.count) for gram in found)
+        if len(self.rows) >= _BATCH:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Write out the events added since the last flush."""
+        self.db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?)", self.rows)
+        self.db.executemany("INSERT OR IGNORE INTO grams VALUES (?, ?)", self.grams)
+        self.rows, self.grams = [], []
+
+    def __enter__(self) -> "Shard":
+        """Return the shard to add events to."""
+        return self
+
+    def __exit__(self, exc_type: Any, *_: Any) -> None:
+        """Commit and move the shard into place, or throw it away if adding events failed."""
+        try:
+            if exc_type is None:
+                self._flush()
+                self.db.commit()
+        finally:
+            self.db.close()
+        if exc_type is None:
+            os.replace(self.partial, self.path)
+        else:
+            os.remove(self.partial)
+
+
+def required(search_string: str, key: str) -> Union[List[str], None]:
+    """Return the substrings an event_data value must contain for a search string to match it.
+
+    :param search_string: An "operator operand" search string.
+    :type search_string: str
+    :param key: The lowercased key path the search string is checked at.
+    :type key: str
+    :return: The substrings, or None if the index can't narrow this search.
+    :rtype: Union[List[str], None]
+    """
+    if key != "event.event_data" and not key.startswith("event.event_data."):
+        return None  # Only event_data values are indexed
+    parsed = operators.parse_operator_and_operand(search_string)
+    if not parsed:
+        return None
+    operator, operand = parsed
+    if operator is operators.equals:
+        literals = [operand]
+    elif operator is operators.regular_expression:
+        try:
+            if re.search(operand, "None"):
+                return None  # It would match a key path the event doesn't have
+        except re.error:
+            return None
+        literals = operators.required_literals(operand)
+    else:
+        return None
+    literals = [literal for literal in literals if len(literal) >= 3]
+    return literals or None
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a shard to read.
+
+    :param path: The shard.
+    :type path: str
+    :return: A connection to it.
+    :rtype: sqlite3.Connection
+    """
+    return sqlite3.connect(path)
+
+
+def count(db: sqlite3.Connection, channel: str) -> int:
+    """Return how many events of a channel a shard holds.
+
+    :param db: An open shard.
+    :type db: sqlite3.Connection
+    :param channel: The event type (log name).
+    :type channel: str
+    :return: The number of events.
+    :rtype: int
+    """
+    return db.execute(
+        "SELECT count(*) FROM events WHERE channel = ?", (channel,)
+    ).fetchone()[0]
+
+
+def candidates(
+    db: sqlite3.Connection,
+    indicator_list: List[Tuple[str, str]],
+    expression: operators.Expression = None,
+) -> Union[Set[int], None]:
+    """Return the IDs of the events in a shard an indicator could match, None if it could match any.
+
+    The candidates of each key are combined the way the indicator's condition combines its keys,
+    and a key the index can't narrow, or one that is negated, could match every event.
+
+    :param db: An open shard.
+    :type db: sqlite3.Connection
+    :param indicator_list: The indicator's (key, search string) pairs.
+    :type indicator_list: List[Tuple[str, str]]
+    :param expression: The indicator's compiled condition, defaults to None for any key matching.
+    :type expression: operators.Expression, optional
+    :return: The candidate event IDs, or None for all of them.
+    :rtype: Union[Set[int], None]
+    """
+
+    def bound(criterion: int, _: Any) -> Union[Set[int], None]:
+        key, search_string = indicator_list[criterion]
+        literals = required(search_string, str(key).lower())
+        if literals is None:
+            return None
+        grams = sorted(set().union(*(_grams(literal) for literal in literals)))
+        query = " INTERSECT ".join(
+            ["SELECT event FROM grams WHERE gram = ?"] * len(grams[:_MAX_GRAMS])
+        )
+        return {row[0] for row in db.execute(query, grams[:_MAX_GRAMS])}
+
+    if expression is None:
+        expression = operators.indicator_expression(indicator_list)
+    return expression.narrow(bound)
+
+
+def read(
+    db: sqlite3.Connection,
+    channel: str,
+    event_id: Union[str, None] = None,
+    ids: Union[Set[int], None] = None,
+    since: str = None,
+    until: str = None,
+) -> Iterator[Tuple[int, dict]]:
+    """Yield the stored events of a channel, in the order they were read.
+
+    :param db: An open shard.
+    :type db: sqlite3.Connection
+    :param channel: The event type (log name) to read.
+    :type channel: str
+    :param event_id: Only read events with this event ID, defaults to None for any.
+    :type event_id: Union[str, None], optional
+    :param ids: Only read these events, defaults to None for all of them.
+    :type ids: Union[Set[int], None], optional
+    :param since: Only read events logged at or after this UTC "YYYY-MM-DD HH:MM:SS", defaults to None
+    :type since: str, optional
+    :param until: Only read events logged at or before this UTC "YYYY-MM-DD HH:MM:SS", defaults to None
+    :type until: str, optional
+    :yield: Each event's ID in the shard and its dict.
+    :rtype: Iterator[Tuple[int, dict]]
+    """
+    query, params = "SELECT id, body FROM events WHERE channel = ?", [channel]
+    if event_id is not None:
+        query, params = query + " AND event_id = ?", params + [event_id]
+    if since:
+        query, params = query + " AND substr(time, 1, 19) >= ?", params + [since]
+    if until:
+        query, params = query + " AND substr(time, 1, 19) <= ?", params + [until]
+    if ids is None:
+        for event, body in db.execute(query + " ORDER BY id", params):
+            yield event, json.loads(body)
+        return
+    # Only the candidates are fetched, in batches under SQLite's limit on query variables
+    ordered = sorted(ids)
+    for start in range(0, len(ordered), _BATCH):
+        batch = ordered[start : start + _BATCH]
+        rows = db.execute(
+            "{} AND id IN ({}) ORDER BY id".format(query, ", ".join("?" * len(batch))),
+            params + batch,
+        )
+        for event, body in rows:
+            yield event, json.loads(body)
@@ -7,7 +7,7 @@ import pkgutil
 from typing import Callable, Dict, List
 
 # cisagov Libraries
-from chirp.common import ADMIN, OS
+from chirp.common import OS, is_admin
 
 
 def _parse_name(plugin: Callable) -> str:
@@ -19,7 +19,7 @@ def _verify_privilege(plugin: Callable) -> bool:
     """Verify proper privilege for plugin."""
     try:
         admin = plugin.REQUIRED_ADMIN
-        if ADMIN or not admin:
+        if not admin or is_admin():
             logging.info("Loaded {}".format(_parse_name(plugin)))
             return True
         else:
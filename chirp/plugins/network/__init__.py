@@ -1,7 +1,11 @@
 """Network plugin initializer."""
 
-from . import scan
-
 REQUIRED_OS = "Windows"
 REQUIRED_ADMIN = True
-entrypoint = scan.run
+
+
+def entrypoint(indicators: list):
+    """Run the network plugin, importing it only once there are indicators for it to run."""
+    from . import scan
+
+    return scan.run(indicators)
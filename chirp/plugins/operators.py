@@ -1,10 +1,27 @@
 """An operators module used by plugins for simple operator, operand queries on their data."""
 
 # Standard Python Libraries
+from bisect import bisect_right
 from functools import lru_cache
+import ipaddress
+from itertools import combinations
+import json
 import logging
 import re
-from typing import Any, Callable, Dict, List, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Tuple,
+    Union,
+)
+
+NONE_TYPES = frozenset(["None", "none", "null", "''", '""', "NULL"])
 
 
 @lru_cache(maxsize=128)
@@ -20,6 +37,13 @@ def OPERATOR_MAP(symbol: str) -> Union[Callable, None]:
         "==": equals,
         "!=": notequals,
         "~=": regular_expression,
+        "in": member,
+        "cidr": in_network,
+        "contains": contains,
+        ">": greater,
+        ">=": greater_or_equal,
+        "<": less,
+        "<=": less_or_equal,
     }
     try:
         return d[symbol]
@@ -55,7 +79,6 @@ def parse_operator_and_operand(search_string: str) -> Union[Tuple[Any, Any], Non
     :return: The operator callable and operand parsed from the search string.
     :rtype: Union[Tuple[Any, Any], None]
     """
-    NONE_TYPES = ["None", "none", "null", "''", '""', "NULL"]
     try:
         s = search_string.split(" ")
     except AttributeError:
@@ -117,6 +140,1086 @@ def regular_expression(check_value: Any, item: Any) -> bool:
     return bool(re.search(check_value, str(item)))
 
 
+def required_literals(pattern: str) -> List[str]:
+    """Return substrings that any text a regular expression finds must contain.
+
+    Only literal runs of 3 or more characters outside groups, classes and alternations are taken,
+    so the result is always safe to rule text out with, if not always as narrow as it could be.
+
+    :param pattern: The regular expression.
+    :type pattern: str
+    :return: The literals, empty if none could be found.
+    :rtype: List[str]
+    """
+    if "|" in pattern or "(?" in pattern:
+        return []
+    runs, run, depth, i = [], "", 0, 0
+    while i < len(pattern):
+        c, literal = pattern[i], None
+        if c == "\\":
+            escaped = pattern[i + 1 : i + 2]
+            if escaped and escaped in "xuUN0123456789":
+                return []  # Escapes that stand for other characters, or backreferences
+            if escaped and not escaped.isalnum():
+                literal = escaped
+            i += 2
+        elif c in "[{":
+            # Skip a class or a repeat count, the first character of a class may be "]"
+            close = "]" if c == "[" else "}"
+            i += 1
+            if c == "[" and pattern[i : i + 1] == "^":
+                i += 1
+            if c == "[" and pattern[i : i + 1] == "]":
+                i += 1
+            while i < len(pattern) and pattern[i] != close:
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+        else:
+            depth += {"(": 1, ")": -1}.get(c, 0)
+            if c not in ".^$*+?()":
+                literal = c
+            i += 1
+        following = pattern[i : i + 1]
+        if literal is not None and depth == 0 and following not in ("*", "?", "{"):
+            run += literal
+            if following != "+":
+                continue
+        runs.append(run)
+        run = ""
+    runs.append(run)
+    return [run for run in runs if len(run) >= 3]
+
+
+def _regex_tokens(pattern: str) -> List[str]:
+    """Split a regular expression into escapes, classes, repeat counts, group openers and characters."""
+    tokens, i = [], 0
+    while i < len(pattern):
+        c, end = pattern[i], i + 1
+        if c == "\\":
+            end = i + 2
+        elif c == "[":
+            if pattern[end : end + 1] == "^":
+                end += 1
+            if pattern[end : end + 1] == "]":
+                end += 1
+            while end < len(pattern) and pattern[end] != "]":
+                end += 2 if pattern[end] == "\\" else 1
+            end += 1
+        elif c == "{":
+            count = re.match(r"\{(\d+,?\d*|,\d+)\}", pattern[i:])
+            if count:
+                end = i + len(count.group())
+        elif c == "(" and pattern[end : end + 1] == "?":
+            # (?:, (?=, (?<!, (?P<name>, or a whole (?i) or (?#comment)
+            while end < len(pattern) and pattern[end] not in ":=!>)":
+                end += 1
+            end += 1
+        tokens.append(pattern[i:end])
+        i = end
+    return tokens
+
+
+def _unbounded(token: str) -> bool:
+    """Return whether a token is a repeat with no upper bound."""
+    return token in ("*", "+") or (token.startswith("{") and token.endswith(",}"))
+
+
+def _wildcard(tokens: List[str], i: int) -> int:
+    """Return how many tokens a greedy or lazy .* at i spans, 0 if there isn't one."""
+    if tokens[i : i + 2] != [".", "*"]:
+        return 0
+    following = tokens[i + 2 : i + 3]
+    if following == ["?"]:
+        return 3
+    if following and (following[0] in ("*", "+") or following[0].startswith("{")):
+        return 0  # A possessive .*+ can't be dropped, and anything else doesn't compile
+    return 2
+
+
+def simplify_pattern(pattern: str) -> str:
+    """Rewrite a regular expression into a cheaper one that finds a match in the same texts.
+
+    Searches are unanchored and only ask whether there is a match, so a leading or trailing .*
+    adds nothing but backtracking: the search tries it at every position, and it runs to the end
+    of the line each time. Those are dropped, as are .* that directly repeat another.
+
+    :param pattern: The regular expression.
+    :type pattern: str
+    :return: The rewritten regular expression, or the same one if nothing could be dropped.
+    :rtype: str
+    """
+    tokens = _regex_tokens(pattern)
+    start = 0
+    while start < len(tokens) and re.fullmatch(r"\(\?[aiLmsux]+\)", tokens[start]):
+        start += 1  # Global flags stay first
+    kept, i, previous = tokens[:start], start, False
+    while i < len(tokens):
+        span = _wildcard(tokens, i)
+        if span and (previous or i == start):
+            i += span
+            continue
+        kept.extend(tokens[i : i + (span or 1)])
+        previous = bool(span)
+        i += span or 1
+    while len(kept) > start:
+        if kept[-2:] == [".", "*"]:
+            del kept[-2:]
+        elif kept[-3:] == [".", "*", "?"]:
+            del kept[-3:]
+        else:
+            break
+    simplified = "".join(kept)
+    try:
+        re.compile(simplified)
+    except re.error:
+        return pattern
+    return simplified
+
+
+# Characters a repeated group's alternatives are tried on, to tell whether they can overlap
+_ALPHABET = tuple(chr(c) for c in range(256))
+
+
+def _first_chars(
+    alternative: List[str], ignore_case: bool
+) -> Union[FrozenSet[str], None]:
+    """Return the characters an alternative of a group can start with, None if that can't be told."""
+    if not alternative or alternative[0].startswith("("):
+        return None
+    if alternative[0] in ("^", "$") or re.fullmatch(r"\\[AbBZ]", alternative[0]):
+        return None  # An anchor matches no character, so the next token starts the text
+    if len(alternative) > 1 and (
+        alternative[1] in ("*", "?") or re.fullmatch(r"\{0*(,\d*)?\}", alternative[1])
+    ):
+        return None  # An optional first token, so the next one can start the text too
+    try:
+        token = re.compile(alternative[0])
+    except re.error:
+        return None
+    chars = [c for c in _ALPHABET if token.fullmatch(c)]
+    return frozenset(c.lower() for c in chars) if ignore_case else frozenset(chars)
+
+
+def _overlapping(alternatives: List[List[str]], ignore_case: bool) -> bool:
+    """Return whether two alternatives of a group could start matching the same text."""
+    if len(alternatives) < 2:
+        return False
+    firsts = [_first_chars(alternative, ignore_case) for alternative in alternatives]
+    if None in firsts:
+        return True
+    return any(a & b for a, b in combinations(firsts, 2))
+
+
+def backtracking_risk(pattern: str) -> Union[str, None]:
+    """Find a construct in a regular expression that can make a failing search backtrack for a long time.
+
+    Flags a repeated group that itself holds a repeat, or alternatives that can start on the same
+    character, which can try exponentially many ways to split the text, and three or more unbounded
+    wildcards, which can try every split. A repeated group of alternatives that start on different
+    characters, such as (a|b)* or (cat|dog)+, only ever has one way to go and is left alone.
+
+    :param pattern: The regular expression.
+    :type pattern: str
+    :return: A description of the risk, or None if none was found.
+    :rtype: Union[str, None]
+    """
+    tokens = _regex_tokens(pattern)
+    ignore_case = bool(tokens) and bool(
+        re.fullmatch(r"\(\?[aLmsux]*i[aiLmsux]*\)", tokens[0])
+    )
+    # Whether each open group holds repeats, and the tokens of each of its alternatives
+    groups, wildcards = [[False, [[]]]], 0
+    for i, token in enumerate(tokens):
+        repeated = _unbounded(tokens[i + 1]) if i + 1 < len(tokens) else False
+        if token.startswith("(") and not token.endswith(")"):
+            groups[-1][1][-1].append(token)
+            groups.append([False, [[]]])
+            continue
+        if token == ")" and len(groups) > 1:
+            repeats, alternatives = groups.pop()
+            if repeated and repeats:
+                return "a repeated group holds a repeat, as in (a+)+"
+            if repeated and _overlapping(alternatives, ignore_case):
+                return "a repeated group holds alternatives that can match the same text, as in (a|ab)*"
+            groups[-1][0] |= repeats
+            groups[-1][1][-1].append(token)
+        elif token == "|":
+            groups[-1][1].append([])
+        else:
+            groups[-1][1][-1].append(token)
+        if repeated:
+            groups[-1][0] = True
+            if token == "." and len(groups) == 1:
+                wildcards += 1
+    if wildcards >= 3:
+        return "{} unbounded wildcards can each try every split of the text".format(
+            wildcards
+        )
+    return None
+
+
+def _items(operand: str) -> List[str]:
+    """Split a list operand, given as a JSON array or separated by commas."""
+    if operand.lstrip().startswith("["):
+        return [str(item) for item in json.loads(operand)]
+    return [item.strip() for item in operand.split(",") if item.strip()]
+
+
+def _number(value: Any) -> Union[int, float]:
+    """Read a value as a number, including the hex strings events hold for IDs and flags.
+
+    :raises ValueError: If it isn't one
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    text = str(value).strip()
+    try:
+        return int(text, 16) if text[:2].lower() == "0x" else int(text)
+    except ValueError:
+        return float(text)
+
+
+class Networks:
+    """A sorted table of the address ranges of a list of networks, searched by bisection.
+
+    :param networks: Networks in CIDR notation (10.0.0.0/8), or single addresses.
+    :type networks: Iterable[str]
+    :raises ValueError: If a network can't be parsed
+    """
+
+    def __init__(self, networks: Iterable[str]) -> None:
+        """Merge the networks into sorted, disjoint ranges for each IP version."""
+        ranges = {4: [], 6: []}
+        for network in networks:
+            network = ipaddress.ip_network(network, strict=False)
+            ranges[network.version].append(
+                (int(network.network_address), int(network.broadcast_address))
+            )
+        self.tables = {}
+        for version, spans in ranges.items():
+            merged = []
+            for first, last in sorted(spans):
+                if merged and first <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], last)
+                else:
+                    merged.append([first, last])
+            self.tables[version] = (
+                [first for first, _ in merged],
+                [last for _, last in merged],
+            )
+
+    def __contains__(self, value: Any) -> bool:
+        """Return whether a value is an address inside one of the networks."""
+        try:
+            address = ipaddress.ip_address(str(value).strip())
+        except ValueError:
+            return False
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped  # ::ffff:10.0.0.1, as logon events record it
+        firsts, lasts = self.tables[address.version]
+        i = bisect_right(firsts, int(address)) - 1
+        return i >= 0 and int(address) <= lasts[i]
+
+
+def compile_operand(operator: Callable, operand: str) -> Any:
+    """Build the structure an operator compares values against from its operand string.
+
+    Set membership gets a hash set, CIDR containment a sorted range table, case-insensitive
+    contains a casefolded string, and numeric comparisons a number. Other operands are unchanged.
+
+    :param operator: The operator function.
+    :type operator: Callable
+    :param operand: The operand string of a search string.
+    :type operand: str
+    :raises ValueError: If the operand doesn't suit the operator
+    :return: The compiled operand.
+    :rtype: Any
+    """
+    if operator is member:
+        return frozenset(_items(operand))
+    if operator is in_network:
+        return Networks(_items(operand))
+    if operator is contains:
+        return operand.casefold()
+    if operator in (greater, greater_or_equal, less, less_or_equal):
+        return _number(operand)
+    return operand
+
+
+def member(check_value: FrozenSet[str], item: Any) -> bool:
+    """Check if an item is one of a set of values.
+
+    :param check_value: The set of values, compiled by compile_operand.
+    :type check_value: FrozenSet[str]
+    :param item: Item to check.
+    :type item: Any
+    :return: Bool of comparison.
+    :rtype: bool
+    """
+    return str(item) in check_value
+
+
+def in_network(check_value: Networks, item: Any) -> bool:
+    """Check if an item is an IP address inside any of a list of networks.
+
+    :param check_value: The networks, compiled by compile_operand.
+    :type check_value: Networks
+    :param item: Item to check.
+    :type item: Any
+    :return: Bool of comparison.
+    :rtype: bool
+    """
+    return item in check_value
+
+
+def contains(check_value: str, item: Any) -> bool:
+    """Check if an item contains a value, ignoring case.
+
+    :param check_value: The casefolded value, compiled by compile_operand.
+    :type check_value: str
+    :param item: Item to search.
+    :type item: Any
+    :return: Bool of comparison.
+    :rtype: bool
+    """
+    return check_value in str(item).casefold()
+
+
+def _compare(item: Any, test: Callable[[Union[int, float]], bool]) -> bool:
+    """Compare an item as a number, an item that isn't one never matches."""
+    try:
+        return test(_number(item))
+    except (TypeError, ValueError):
+        return False
+
+
+def greater(check_value: Union[int, float], item: Any) -> bool:
+    """Check if an item is a number greater than a value.
+
+    :param check_value: The number, compiled by compile_operand.
+    :type check_value: Union[int, float]
+    :param item: Item to check.
+    :type item: Any
+    :return: Bool of comparison.
+    :rtype: bool
+    """
+    return _compare(item, lambda number: number > check_value)
+
+
+def greater_or_equal(check_value: Union[int, float], item: Any) -> bool:
+    """Check if an item is a number greater than or equal to a value.
+
+    :param check_value: The number, compiled by compile_operand.
+    :type check_value: Union[int, float]
+    :param item: Item to check.
+    :type item: Any
+    :return: Bool of comparison.
+    :rtype: bool
+    """
+    return _compare(item, lambda number: number >= check_value)
+
+
+def less(check_value: Union[int, float], item: Any) -> bool:
+    """Check if an item is a number less than a value.
+
+    :param check_value: The number, compiled by compile_operand.
+    :type check_value: Union[int, float]
+    :param item: Item to check.
+    :type item: Any
+    :return: Bool of comparison.
+    :rtype: bool
+    """
+    return _compare(item, lambda number: number < check_value)
+
+
+def less_or_equal(check_value: Union[int, float], item: Any) -> bool:
+    """Check if an item is a number less than or equal to a value.
+
+    :param check_value: The number, compiled by compile_operand.
+    :type check_value: Union[int, float]
+    :param item: Item to check.
+    :type item: Any
+    :return: Bool of comparison.
+    :rtype: bool
+    """
+    return _compare(item, lambda number: number <= check_value)
+
+
+def leaves(item: Any) -> Iterator[Any]:
+    """Yield every value a search compares beneath an item, recursing through nested dicts.
+
+    :param item: The item to search.
+    :type item: Any
+    :yield: Each value that is not a dict, or the item itself if it is not one.
+    :rtype: Iterator[Any]
+    """
+    if isinstance(item, dict):
+        for v in item.values():
+            yield from leaves(v)
+    else:
+        yield item
+
+
+def bits(bitmap: int) -> Iterator[int]:
+    """Yield the positions of the set bits of a bitmap, lowest first.
+
+    :param bitmap: A bitmap over a block of records, bit i standing for record i.
+    :type bitmap: int
+    :yield: Each set position.
+    :rtype: Iterator[int]
+    """
+    while bitmap:
+        low = bitmap & -bitmap
+        yield low.bit_length() - 1
+        bitmap ^= low
+
+
+def _count(bitmap: int) -> int:
+    """Return how many bits of a bitmap are set."""
+    return bin(bitmap).count("1")
+
+
+class Predicate(NamedTuple):
+    """A search string and key compiled once, to be checked against any number of items.
+
+    The operator is resolved, a regular expression is compiled, and a dotted key is split into the
+    path it drills down, so checking an item does none of that work again. A regular expression
+    also keeps the literals it requires, and only runs on text that contains all of them.
+    """
+
+    operator: Callable[[Any, Any], bool]
+    operand: Any
+    pattern: Union[re.Pattern, None]
+    path: Union[Tuple[str, ...], None]
+    literals: Tuple[str, ...] = ()
+
+    def test(self, value: Any) -> bool:
+        """Compare a single value.
+
+        :param value: The value to compare.
+        :type value: Any
+        :return: Whether it matches.
+        :rtype: bool
+        """
+        if self.pattern is not None:
+            text = str(value)
+            for literal in self.literals:
+                if literal not in text:
+                    return False
+            return self.pattern.search(text) is not None
+        return self.operator(self.operand, value)
+
+    def search(
+        self, record: "Record", test: Callable[["Predicate", Any], bool] = None
+    ) -> bool:
+        """Search a record view of an item the way searcher searches the item.
+
+        :param record: The record view.
+        :type record: Record
+        :param test: A stand in for Predicate.test, defaults to None
+        :type test: Callable[[Predicate, Any], bool], optional
+        :return: Whether any value at the path, or beneath the item when there is no path, matches.
+        :rtype: bool
+        """
+        if self.literals:
+            # No value can match if the values together lack one of the literals
+            text = record.text(self.path)
+            for literal in self.literals:
+                if literal not in text:
+                    return False
+        test = test or Predicate.test
+        for value in record.values(self.path):
+            if test(self, value):
+                return True
+        return False
+
+    def search_block(
+        self,
+        records: List["Record"],
+        mask: int = None,
+        test: Callable[["Predicate", Any], bool] = None,
+    ) -> int:
+        """Search a block of record views at once.
+
+        A regular expression's literals are looked for in the texts of the whole block, joined
+        into one buffer, and each one found is mapped back to its record by offset. Only the
+        records holding every literal are then searched.
+
+        :param records: The block of record views.
+        :type records: List[Record]
+        :param mask: A bitmap of the records to search, defaults to None for all of them.
+        :type mask: int, optional
+        :param test: A stand in for Predicate.test, defaults to None
+        :type test: Callable[[Predicate, Any], bool], optional
+        :return: A bitmap of the records that match.
+        :rtype: int
+        """
+        if mask is None:
+            mask = (1 << len(records)) - 1
+        if self.literals and mask:
+            mask = _containing(records, self.path, self.literals, mask)
+        test = test or Predicate.test
+        path, found = self.path, 0
+        for i in bits(mask):
+            for value in records[i].values(path):
+                if test(self, value):
+                    found |= 1 << i
+                    break
+        return found
+
+    def __call__(self, item: Any) -> bool:
+        """Search an item the way searcher does.
+
+        :param item: An item, or a Record view of one, to search against.
+        :type item: Any
+        :return: Whether any value at the path, or beneath the item when there is no path, matches.
+        :rtype: bool
+        """
+        return self.search(item if isinstance(item, Record) else Record(item))
+
+
+class Record:
+    """A view of one item that every predicate checked against it shares.
+
+    The values at each key path are found once, however many predicates search that path, and
+    are joined into one string the first time a predicate needs to look for its literals.
+
+    :param item: The item to view.
+    :type item: Any
+    """
+
+    __slots__ = ("item", "_values", "_texts")
+
+    def __init__(self, item: Any) -> None:
+        """View an item, nothing is read from it until a predicate asks."""
+        self.item = item
+        self._values = {}
+        self._texts = {}
+
+    def _resolve(self, path: Union[Tuple[str, ...], None]) -> Tuple[Any, ...]:
+        """Find the values at a key path, a missing key path has the one value None."""
+        item = self.item
+        if path is not None:
+            for k in path:
+                try:
+                    item = item[k]
+                except KeyError:
+                    return (None,)
+        return tuple(leaves(item))
+
+    def values(self, path: Union[Tuple[str, ...], None]) -> Tuple[Any, ...]:
+        """Return every value searched at a key path.
+
+        :param path: The split key path, None for the whole item.
+        :type path: Union[Tuple[str, ...], None]
+        :return: The values, in the order searcher compares them.
+        :rtype: Tuple[Any, ...]
+        """
+        try:
+            return self._values[path]
+        except KeyError:
+            values = self._values[path] = self._resolve(path)
+            return values
+
+    def text(self, path: Union[Tuple[str, ...], None]) -> str:
+        """Return the string forms of the values at a key path, joined by NUL characters.
+
+        :param path: The split key path, None for the whole item.
+        :type path: Union[Tuple[str, ...], None]
+        :return: The joined text.
+        :rtype: str
+        """
+        try:
+            return self._texts[path]
+        except KeyError:
+            text = self._texts[path] = "\x00".join(map(str, self.values(path)))
+            return text
+
+
+def _containing(
+    records: List[Record],
+    path: Union[Tuple[str, ...], None],
+    literals: Tuple[str, ...],
+    mask: int,
+) -> int:
+    """Narrow a bitmap of records to those whose text at a path holds every literal."""
+    positions = list(bits(mask))
+    texts = [records[i].text(path) for i in positions]
+    # Literals never hold a NUL, so one found in the joined buffer lies within one record
+    joined = "\x00".join(texts)
+    starts, offset = [], 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text) + 1
+    starts.append(offset)
+    for literal in literals:
+        kept, at = 0, joined.find(literal)
+        while at >= 0:
+            k = bisect_right(starts, at) - 1
+            kept |= 1 << positions[k]
+            at = joined.find(
+                literal, starts[k + 1]
+            )  # The record is in, skip to the next
+        mask &= kept
+        if not mask:
+            break
+    return mask
+
+
+@lru_cache(maxsize=1024)
+def _compile(search_string: str, key: Union[str, None]) -> Union[Predicate, None]:
+    """Compile a search string and key, once for each pair."""
+    parsed = parse_operator_and_operand(search_string)
+    if not parsed or parsed[0] is None:
+        return None
+    operator, operand = parsed
+    pattern, literals = None, ()
+    if operator is regular_expression:
+        try:
+            pattern = re.compile(simplify_pattern(operand))
+        except re.error as e:
+            logging.error(
+                "(OPERATORS) Invalid regular expression '{}': {}".format(operand, e)
+            )
+            return None
+        risk = backtracking_risk(pattern.pattern)
+        if risk:
+            logging.warning(
+                "(OPERATORS) Regular expression '{}' may backtrack for a long time: {}.".format(
+                    operand, risk
+                )
+            )
+        # Longest first, as the longest literal is usually the rarest. Literals holding the NUL
+        # that Record.text joins values with could be found across two values, so are left out.
+        literals = required_literals(operand)
+        literals = tuple(
+            sorted(
+                {lit for lit in literals if "\x00" not in lit}, key=len, reverse=True
+            )
+        )
+    else:
+        try:
+            operand = compile_operand(operator, operand)
+        except ValueError as e:
+            logging.error("(OPERATORS) Invalid operand '{}': {}".format(operand, e))
+            return None
+    path = tuple(key.split(".")) if key and "." in key else None
+    return Predicate(operator, operand, pattern, path, literals)
+
+
+def compile_predicate(search_string: Any, key: Any = None) -> Union[Predicate, None]:
+    """Compile a search string in the format of "operator operand", and the key it drills into.
+
+    :param search_string: The search string to compile.
+    :type search_string: Any
+    :param key: An optional key to use to drill into data., defaults to None
+    :type key: Any, optional
+    :return: The predicate, or None if the search string can't be parsed.
+    :rtype: Union[Predicate, None]
+    """
+    if not isinstance(search_string, str):
+        logging.error(
+            "(OPERATORS) search string '{}' appears to be the wrong data type.".format(
+                search_string
+            )
+        )
+        return None
+    return _compile(search_string, key if isinstance(key, str) else None)
+
+
+# An AND or OR node reorders its operands after this many evaluations
+_REORDER = 256
+
+
+def _cost(predicate: Union[Predicate, None]) -> float:
+    """Estimate what checking a predicate costs, relative to comparing one value."""
+    if predicate is None:
+        return 0.0  # It never matches, and costs nothing to find that out
+    cost = 1.0
+    if predicate.pattern is not None:
+        # Literals rule most text out before the expression runs
+        cost = 2.0 if predicate.literals else 8.0
+    if predicate.path is None:
+        cost *= 4  # It searches every value of the item
+    return cost
+
+
+class Expression:
+    """A boolean condition over an indicator's criteria, compiled once and evaluated with short-circuiting.
+
+    Each node counts how often it is evaluated and how often it is true. Every so often an AND
+    node puts first the operands that are cheapest for each time they are false, and an OR node
+    the operands that are cheapest for each time they are true, so that a record is decided after
+    as little work as the records seen so far suggest. The order never changes the verdict.
+
+    :param operator: "and", "or", "not", or "criterion" for a leaf.
+    :type operator: str
+    :param operands: The child nodes, empty for a leaf.
+    :type operands: List[Expression]
+    :param criterion: A leaf's position in the indicator's criteria, defaults to None
+    :type criterion: int, optional
+    :param predicate: A leaf's compiled predicate, defaults to None
+    :type predicate: Union[Predicate, None], optional
+    """
+
+    __slots__ = (
+        "operator",
+        "operands",
+        "criterion",
+        "predicate",
+        "cost",
+        "runs",
+        "trues",
+    )
+
+    def __init__(
+        self,
+        operator: str,
+        operands: List["Expression"],
+        criterion: int = None,
+        predicate: Union[Predicate, None] = None,
+    ) -> None:
+        """Build a node, with its static cost estimate."""
+        self.operator = operator
+        self.operands = operands
+        self.criterion = criterion
+        self.predicate = predicate
+        if operator == "criterion":
+            self.cost = _cost(predicate)
+        else:
+            self.cost = sum(operand.cost for operand in operands)
+        self.runs = 0
+        self.trues = 0
+
+    def evaluate(
+        self, record: Record, search: Callable[[Union[Predicate, None], Record], bool]
+    ) -> bool:
+        """Evaluate the condition against a record view of an item.
+
+        :param record: The record view, shared by every predicate checked against the item.
+        :type record: Record
+        :param search: Searches the record with a leaf's predicate, which may be None.
+        :type search: Callable[[Union[Predicate, None], Record], bool]
+        :return: Whether the item meets the condition.
+        :rtype: bool
+        """
+        operator = self.operator
+        if operator == "criterion":
+            verdict = search(self.predicate, record)
+        elif operator == "not":
+            verdict = not self.operands[0].evaluate(record, search)
+        else:
+            # Both stop at the first operand that decides them
+            stop = operator == "or"
+            verdict = not stop
+            for operand in self.operands:
+                if operand.evaluate(record, search) == stop:
+                    verdict = stop
+                    break
+        self.runs += 1
+        self.trues += verdict
+        if self.runs % _REORDER == 0 and len(self.operands) > 1:
+            self.reorder()
+        return verdict
+
+    def evaluate_block(
+        self,
+        records: List[Record],
+        search_block: Callable[[Union[Predicate, None], List[Record], int], int],
+        mask: int = None,
+    ) -> int:
+        """Evaluate the condition against a block of record views at once.
+
+        Short-circuiting works on bitmaps: an AND only passes the records its earlier operands
+        kept on to the next one, and an OR only those its earlier operands didn't match.
+
+        :param records: The block of record views.
+        :type records: List[Record]
+        :param search_block: Searches the records of a bitmap with a leaf's predicate, which may be None, returning a bitmap of those that match.
+        :type search_block: Callable[[Union[Predicate, None], List[Record], int], int]
+        :param mask: A bitmap of the records to evaluate, defaults to None for all of them.
+        :type mask: int, optional
+        :return: A bitmap of the records that meet the condition.
+        :rtype: int
+        """
+        if mask is None:
+            mask = (1 << len(records)) - 1
+        if not mask:
+            return 0
+        operator = self.operator
+        if operator == "criterion":
+            found = search_block(self.predicate, records, mask)
+        elif operator == "not":
+            found = mask & ~self.operands[0].evaluate_block(records, search_block, mask)
+        elif operator == "and":
+            found = mask
+            for operand in self.operands:
+                found = operand.evaluate_block(records, search_block, found)
+                if not found:
+                    break
+        else:
+            found, left = 0, mask
+            for operand in self.operands:
+                matched = operand.evaluate_block(records, search_block, left)
+                found |= matched
+                left &= ~matched
+                if not left:
+                    break
+        runs = self.runs
+        self.runs += _count(mask)
+        self.trues += _count(found)
+        if self.runs // _REORDER != runs // _REORDER and len(self.operands) > 1:
+            self.reorder()
+        return found
+
+    def _rate(self) -> float:
+        """Estimate how often the node is true, starting from even odds."""
+        return (self.trues + 1) / (self.runs + 2)
+
+    def reorder(self) -> None:
+        """Order an AND or OR node's operands by expected cost of deciding it, from the stats so far."""
+        if self.operator == "and":
+            self.operands.sort(key=lambda operand: operand.cost / (1 - operand._rate()))
+        elif self.operator == "or":
+            self.operands.sort(key=lambda operand: operand.cost / operand._rate())
+
+    def predicates(self) -> Iterator[Predicate]:
+        """Yield the predicate of every criterion the condition checks.
+
+        :yield: Each compiled predicate, leaving out those that couldn't be compiled.
+        :rtype: Iterator[Predicate]
+        """
+        if self.predicate is not None:
+            yield self.predicate
+        for operand in self.operands:
+            yield from operand.predicates()
+
+    def share(self, unique: Dict[Predicate, Predicate]) -> None:
+        """Swap each criterion's predicate for an equal one already compiled for another indicator.
+
+        :param unique: Every predicate shared so far, by itself, which this one's are added to.
+        :type unique: Dict[Predicate, Predicate]
+        """
+        if self.predicate is not None:
+            self.predicate = unique.setdefault(self.predicate, self.predicate)
+        for operand in self.operands:
+            operand.share(unique)
+
+    def narrow(
+        self, bound: Callable[[int, Union[Predicate, None]], Union[set, None]]
+    ) -> Union[set, None]:
+        """Combine sets that bound what each criterion can match into one that bounds the condition.
+
+        :param bound: Given a leaf's criterion and predicate, returns a set holding everything it
+            could match, or None if it could match anything.
+        :type bound: Callable[[int, Union[Predicate, None]], Union[set, None]]
+        :return: A set holding everything the condition could match, or None for anything.
+        :rtype: Union[set, None]
+        """
+        if self.operator == "criterion":
+            return bound(self.criterion, self.predicate)
+        if self.operator == "not":
+            return None  # What an operand can't match is unbounded
+        bounds = []
+        for operand in self.operands:
+            found = operand.narrow(bound)
+            if found is not None:
+                bounds.append(found)
+            elif self.operator == "or":
+                return None  # One operand could match anything, so the OR could too
+        if self.operator == "and":
+            return set.intersection(*bounds) if bounds else None
+        return set().union(*bounds)
+
+
+def _tokens(condition: str) -> List[str]:
+    """Split a condition into parentheses and words."""
+    return condition.replace("(", " ( ").replace(")", " ) ").split()
+
+
+def _parse(tokens: List[str], criteria: Dict[str, "Expression"]) -> Expression:
+    """Parse an OR of ANDs of optionally negated criteria or parenthesised conditions.
+
+    :raises ValueError: If the condition is malformed or names a criterion the indicator lacks
+    """
+
+    def either() -> Expression:
+        operands = [both()]
+        while tokens and tokens[0].lower() == "or":
+            tokens.pop(0)
+            operands.append(both())
+        return operands[0] if len(operands) == 1 else Expression("or", operands)
+
+    def both() -> Expression:
+        operands = [one()]
+        while tokens and tokens[0].lower() == "and":
+            tokens.pop(0)
+            operands.append(one())
+        return operands[0] if len(operands) == 1 else Expression("and", operands)
+
+    def one() -> Expression:
+        if not tokens:
+            raise ValueError("it ends early")
+        token = tokens.pop(0)
+        if token.lower() == "not":
+            return Expression("not", [one()])
+        if token == "(":
+            node = either()
+            if not tokens or tokens.pop(0) != ")":
+                raise ValueError("a parenthesis is not closed")
+            return node
+        try:
+            leaf = criteria[token.lower()]
+        except KeyError:
+            raise ValueError("there is no criterion '{}'".format(token))
+        # A criterion named twice gets its own node, so each node has one parent to order it
+        return Expression("criterion", [], leaf.criterion, leaf.predicate)
+
+    node = either()
+    if tokens:
+        raise ValueError("unexpected '{}'".format(tokens[0]))
+    return node
+
+
+def compile_expression(
+    indicator_list: List[Tuple[str, str]], condition: Any = None
+) -> Expression:
+    """Compile an indicator's criteria, and the condition that combines them.
+
+    A condition combines criteria, named by their keys, with "and", "or", "not" and parentheses,
+    e.g. "event.event_data.logon_type and not event.event_data.ip_address". Without one, an
+    indicator matches when any of its criteria matches.
+
+    :param indicator_list: A list containing tuples of keys and search strings.
+    :type indicator_list: List[Tuple[str, str]]
+    :param condition: The indicator's condition, defaults to None
+    :type condition: Any, optional
+    :return: The compiled condition, which matches nothing if it can't be parsed.
+    :rtype: Expression
+    """
+    nodes = [
+        Expression("criterion", [], i, compile_predicate(search_string, key.lower()))
+        for i, (key, search_string) in enumerate(indicator_list)
+    ]
+    if condition is None:
+        return nodes[0] if len(nodes) == 1 else Expression("or", nodes)
+    try:
+        return _parse(
+            _tokens(str(condition)),
+            {key.lower(): node for (key, _), node in zip(indicator_list, nodes)},
+        )
+    except ValueError as e:
+        logging.error("(OPERATORS) Invalid condition '{}': {}".format(condition, e))
+        return Expression("or", [])
+
+
+@lru_cache(maxsize=1024)
+def _cached_expression(
+    indicator_list: Tuple[Tuple[str, str], ...], condition: Any
+) -> Expression:
+    """Compile an indicator's criteria and condition, once for each indicator."""
+    return compile_expression(list(indicator_list), condition)
+
+
+def indicator_expression(
+    indicator_list: List[Tuple[str, str]], condition: Any = None
+) -> Expression:
+    """Return an indicator's compiled condition, compiling it the first time it is asked for.
+
+    For callers that check one event or value at a time, so an indicator is compiled, and a bad
+    condition logged, once rather than on every check.
+
+    :param indicator_list: A list containing tuples of keys and search strings.
+    :type indicator_list: List[Tuple[str, str]]
+    :param condition: The indicator's condition, defaults to None
+    :type condition: Any, optional
+    :return: The compiled condition, which matches nothing if it can't be parsed.
+    :rtype: Expression
+    """
+    try:
+        return _cached_expression(tuple(indicator_list), condition)
+    except TypeError:  # Search strings of the wrong type can't be keyed on, or cached
+        return compile_expression(indicator_list, condition)
+
+
+def search_block(
+    predicate: Union[Predicate, None], records: List[Record], mask: int
+) -> int:
+    """Search the records of a bitmap with a predicate, a predicate that couldn't be compiled never matches.
+
+    :param predicate: The predicate, None for a search string that can't be parsed.
+    :type predicate: Union[Predicate, None]
+    :param records: The block of record views.
+    :type records: List[Record]
+    :param mask: A bitmap of the records to search.
+    :type mask: int
+    :return: A bitmap of the records that match.
+    :rtype: int
+    """
+    if predicate is None:
+        return 0
+    return predicate.search_block(records, mask)
+
+
+class SharedSearch:
+    """Searches a block of records once per unique predicate, however many criteria use it.
+
+    Predicates are told apart by identity, so those of different indicators should first be
+    made one with Expression.share. The bitmap of records each predicate has searched, and
+    of those it matched, are kept, and only records it hasn't searched yet are searched.
+
+    :param search_block: Searches the records of a bitmap with a predicate.
+    :type search_block: Callable[[Union[Predicate, None], List[Record], int], int]
+    """
+
+    __slots__ = ("search_block", "results", "saved")
+
+    def __init__(
+        self, search_block: Callable[[Union[Predicate, None], List[Record], int], int]
+    ) -> None:
+        """Start with nothing searched."""
+        self.search_block = search_block
+        self.results = {}
+        self.saved = 0
+
+    def __call__(
+        self, predicate: Union[Predicate, None], records: List[Record], mask: int
+    ) -> int:
+        """Search the records of a bitmap, reusing what this predicate found before.
+
+        :param predicate: The predicate, None for a search string that can't be parsed.
+        :type predicate: Union[Predicate, None]
+        :param records: The block of record views, the same block on every call.
+        :type records: List[Record]
+        :param mask: A bitmap of the records to search.
+        :type mask: int
+        :return: A bitmap of the records that match.
+        :rtype: int
+        """
+        if predicate is None:
+            return 0
+        searched, found = self.results.get(id(predicate), (0, 0))
+        self.saved += _count(mask & searched)
+        needed = mask & ~searched
+        if needed:
+            found |= self.search_block(predicate, records, needed)
+            self.results[id(predicate)] = (searched | needed, found)
+        return found & mask
+
+
+def search(predicate: Union[Predicate, None], record: Record) -> bool:
+    """Search a record with a predicate, a predicate that couldn't be compiled never matches.
+
+    :param predicate: The predicate, None for a search string that can't be parsed.
+    :type predicate: Union[Predicate, None]
+    :param record: The record view to search.
+    :type record: Record
+    :return: Whether the record matches.
+    :rtype: bool
+    """
+    return predicate is not None and predicate.search(record)
+
+
 def searcher(check_value: Any, item: Any, key: Any = None) -> Union[bool, None]:
     """Search a given item, given a check value and optionally a key.
 
@@ -129,17 +1232,6 @@ def searcher(check_value: Any, item: Any, key: Any = None) -> Union[bool, None]:
     :return: A boolean value of the match or None if there is an error.
     :rtype: Union[bool, None]
     """
-    parsed = parse_operator_and_operand(check_value)
-    if parsed:
-        operator, operand = parsed
-        if key and "." in key:
-            search_item = navigate_structure(item, key.split("."))
-            return searcher(check_value, search_item, None)
-        elif isinstance(item, dict):
-            for _, v in item.items():
-                if not searcher(check_value, v, key):
-                    continue
-                else:
-                    return True
-        else:
-            return operator(operand, item)
+    predicate = compile_predicate(check_value, key)
+    if predicate:
+        return predicate(item)
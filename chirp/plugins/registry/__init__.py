@@ -1,7 +1,11 @@
 """Registry plugin initializer."""
 
-from . import scan
-
 REQUIRED_OS = "Windows"
 REQUIRED_ADMIN = False
-entrypoint = scan.run
+
+
+def entrypoint(indicators: list):
+    """Run the registry plugin, importing it only once there are indicators for it to run."""
+    from . import scan
+
+    return scan.run(indicators)
@@ -13,33 +13,35 @@ from chirp.plugins.registry.registry import enumerate_registry_values
 
 
 async def check_matches(
-    indicator_list: List[Tuple[str, str]], registry_key: str
+    indicator_list: List[Tuple[str, str]],
+    registry_key: str,
+    expression: operators.Expression = None,
 ) -> Tuple[int, List[Dict[str, str]], Union[str, dict]]:
     """Check for registry key matches to a list of indicators.
 
+    The indicator's condition is evaluated with short-circuiting, so the key is decided as soon
+    as one criterion settles it.
+
     :param indicator_list: A list containing tuples of keys and search strings
     :type indicator_list: List[Tuple[str,str]]
     :param registry_key: A registry key to query
     :type registry_key: str
+    :param expression: The indicator compiled by operators.compile_expression, defaults to None which compiles it, once, with no condition.
+    :type expression: operators.Expression, optional
     :return: A tuple of (hits, the search criteria, matches)
     :rtype: Tuple[int, List[Dict[str,str]], Union[str, dict]]
     """
-    hits = 0
-    search_criteria = []
     match = ""
-    for key, search_string in indicator_list:
-        _match = None
-        if not match:
-            if operators.searcher(search_string, registry_key, key.lower()):
-                _match = registry_key
-        else:
-            if operators.searcher(search_string, match, key.lower()):
-                _match = match
-        hits += 1
-        search_criteria.append({"key": str(key), "search_string": search_string})
-        if _match:
-            match = _match
-    return hits, search_criteria, match
+    if expression is None:
+        expression = operators.indicator_expression(indicator_list)
+    record = operators.Record(registry_key)  # Shared by every criterion
+    if expression.evaluate(record, operators.search):
+        match = registry_key
+    search_criteria = [
+        {"key": str(key), "search_string": search_string}
+        for key, search_string in indicator_list
+    ]
+    return len(indicator_list), search_criteria, match
 
 
 async def _report_hits(indicator: str, vals: dict) -> None:
@@ -60,20 +62,36 @@ async def run(indicators: dict) -> None:
         return
     logging.debug("(REGISTRY) Entered registry plugin.")
     report = {indicator["name"]: build_report(indicator) for indicator in indicators}
+    # Values by key, so a key several indicators check is only read once
+    read = {}
     for indicator in indicators:
         ind = indicator["indicator"]
-        indicator_list = [(k, v) for k, v in ind.items() if k != "registry_key"]
-        logging.log(REGISTRY, "Reading {}".format(ind["registry_key"]))
-        async for value in enumerate_registry_values(ind["registry_key"]):
-            if value == "ERROR":
-                logging.log(REGISTRY, "Hit an error, exiting.")
-                return
-            hits, search_criteria, match = await check_matches(indicator_list, value)
-            if hits != len(indicator_list):
-                continue
-            report[indicator["name"]]["_search_criteria"] = search_criteria
-            if match:
-                report[indicator["name"]]["matches"].append(match)
+        indicator_list = [
+            (k, v) for k, v in ind.items() if k not in ["registry_key", "condition"]
+        ]
+        expression = operators.compile_expression(indicator_list, ind.get("condition"))
+        if ind["registry_key"] not in read:
+            logging.log(REGISTRY, "Reading {}".format(ind["registry_key"]))
+            values = []
+            async for value in enumerate_registry_values(ind["registry_key"]):
+                if value == "ERROR":
+                    logging.log(REGISTRY, "Hit an error, exiting.")
+                    return
+                values.append(value)
+            read[ind["registry_key"]] = values
+        values = read[ind["registry_key"]]
+        if not values:
+            continue
+        # Every value of the key is matched at once, as one block
+        records = [operators.Record(value) for value in values]
+        matched = expression.evaluate_block(records, operators.search_block)
+        report[indicator["name"]]["_search_criteria"] = [
+            {"key": str(key), "search_string": search_string}
+            for key, search_string in indicator_list
+        ]
+        report[indicator["name"]]["matches"].extend(
+            values[i] for i in operators.bits(matched)
+        )
     [await _report_hits(k, v) for k, v in report.items()]
     with open(os.path.join(OUTPUT_DIR, "registry.json"), "w+") as writeout:
         writeout.write(
@@ -1,5 +1,8 @@
 """Yara plugin initializer."""
 
-from . import run
 
-entrypoint = run.run
+def entrypoint(indicators: list):
+    """Run the yara plugin, importing it only once there are indicators for it to run."""
+    from . import run
+
+    return run.run(indicators)
@@ -1,9 +1,10 @@
 """Provides a coroutine to run yara rules against a set of files."""
 
 # Standard Python Libraries
-from functools import lru_cache, partial
+from functools import lru_cache
 from glob import iglob
 import hashlib
+import io
 import itertools
 import json
 import logging
@@ -14,7 +15,8 @@ import string
 from typing import Any, Dict, Iterator, List, Tuple, Union
 
 # cisagov Libraries
-from chirp.common import OS, OUTPUT_DIR, TARGETS, YARA, build_report
+from chirp import load
+from chirp.common import OS, OUTPUT_DIR, TARGETS, YARA, build_report, setup_logging
 
 try:
     # Third-Party Libraries
@@ -94,6 +96,14 @@ if HAS_LIBS:
         """
         return yara.compile(sources=dict(indicators))
 
+    def _saved_rules(indicators: Tuple[Tuple[str, str], ...]) -> bytes:
+        """Compile yara rules and return them saved, so they can be cached and sent to workers."""
+        saved = io.BytesIO()
+        compile_rules(indicators).save(file=saved)
+        return saved.getvalue()
+
+    _RULES = None
+
     def _sha256(filepath):
         try:
             return hashlib.sha256(
@@ -101,13 +111,14 @@ if HAS_LIBS:
                     x.rstrip() for x in open(filepath, "r", encoding="utf8").readlines()
                 ).encode()
             ).hexdigest()
-        except (PermissionError, UnicodeError):
+        except (PermissionError, IsADirectoryError, UnicodeError):
             return None
 
     def _generate_hashes(path="./indicators/*"):
         return (_sha256(f) for f in iglob(path))
 
-    HASHES = list(_generate_hashes())
+    # Hashes of the indicator files, so they are not matched as hits. Set in each worker
+    HASHES = frozenset()
 
     def _compare_hash(path):
         try:
@@ -115,7 +126,7 @@ if HAS_LIBS:
         except MemoryError:
             return False
 
-    def _run(indicators, count_path) -> Union[Dict[str, Any], None]:
+    def _run(count_path) -> Union[Dict[str, Any], None]:
         """Handle our multiprocessing tasks."""
         count, path = count_path
         if count == 1:
@@ -126,14 +137,8 @@ if HAS_LIBS:
                 "We're still working on scanning files. {} processed.".format(count),
             )
         if os.path.exists(path) and not os.path.isdir(path) and not _compare_hash(path):
-            _indicators = [
-                (indicator["name"], indicator["indicator"]["rule"])
-                for indicator in indicators
-            ]
-            yara_rules = compile_rules(tuple(_indicators))
-
             try:
-                matches = yara_rules.match(path)
+                matches = _RULES.match(path)
                 if matches:
                     for match in matches:
                         attrs = ["meta", "namespace", "rule", "strings", "tags"]
@@ -149,12 +154,17 @@ if HAS_LIBS:
                     )
                 )
 
-    def _signal_handler():
-        """Handle keyboard interrupts received during multiprocessing.
+    def _signal_handler(rules: bytes = None, hashes: frozenset = frozenset()):
+        """Handle keyboard interrupts received during multiprocessing, and load the compiled rules and indicator hashes.
 
         Reference: `John Reese <https://jreese.sh/blog/python-multiprocessing-keyboardinterrupt>`_
         """
+        global _RULES, HASHES
         signal.signal(signal.SIGINT, signal.SIG_IGN)
+        setup_logging()
+        if rules is not None:
+            _RULES = yara.load(file=io.BytesIO(rules))
+        HASHES = hashes
 
     async def run(indicators: dict) -> None:
         """Accept a dict containing yara indicators and write out to the OUTPUT_DIR specified by chirp.common.
@@ -170,7 +180,8 @@ if HAS_LIBS:
         files = (
             [i["indicator"]["files"] for i in indicators] if not TARGETS else TARGETS
         )
-        files = "\\**" if "\\**" in files else ", ".join(files)
+        # Indicators of several activities often share targets, which are walked once
+        files = "\\**" if "\\**" in files else ", ".join(dict.fromkeys(files))
 
         logging.info("Yara targets: {}".format(files))
 
@@ -190,11 +201,29 @@ if HAS_LIBS:
         hits = 0
         count = 0
 
+        # Rules are compiled once, or loaded from the indicator bundle, and each worker loads them
+        sources = tuple(
+            (indicator["name"], indicator["indicator"]["rule"])
+            for indicator in indicators
+        )
+        rules = load.compiled("yara", _saved_rules, sources)
+        try:
+            yara.load(file=io.BytesIO(rules))
+        except yara.Error as e:
+            # Saved by a yara the installed one can't load, so compiled again in its place
+            logging.debug(
+                "Could not load the bundled yara rules, recompiling: {}".format(e)
+            )
+            rules = load.compiled("yara", _saved_rules, sources, rebuild=True)
+
         # Normalize every path, for every path
         try:
-            with Pool(initializer=_signal_handler) as pool:
+            with Pool(
+                initializer=_signal_handler,
+                initargs=(rules, frozenset(_generate_hashes())),
+            ) as pool:
                 for result in pool.imap_unordered(
-                    partial(_run, indicators),
+                    _run,
                     enumerate(normalize_paths(files), 1),
                     chunksize=1000,
                 ):
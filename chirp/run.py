@@ -7,16 +7,16 @@ import os
 from typing import Callable, Dict, Iterable, Iterator, List
 
 # cisagov Libraries
-from chirp import load
-from chirp.common import ACTIVITY, OUTPUT_DIR, PLUGINS
+from chirp import common, load
 from chirp.plugins import events, loader, network, registry, yara  # noqa: F401
 
 
 def run() -> None:
     """Run plugins and write out output."""
-    if not os.path.exists(OUTPUT_DIR):
-        os.mkdir(OUTPUT_DIR)
-    loaded_plugins = loader.load(PLUGINS)
+    common.setup_logging()
+    if not os.path.exists(common.OUTPUT_DIR):
+        os.mkdir(common.OUTPUT_DIR)
+    loaded_plugins = loader.load(common.PLUGINS)
     run_plugins(loaded_plugins)
 
 
@@ -36,9 +36,10 @@ async def _run_coroutines(plugins: Dict[str, Callable]) -> None:
     :param plugins: A dictionary with the name of a plugin as the key and its entrypoint as the value.
     :type plugins: Dict[str, Callable]
     """
-    _indicators = list(
+    # Every activity's indicators go into one plan, so each artifact is only read once
+    _indicators = merge_activities(
         check_valid_indicator_types(
-            load.from_yaml(get_indicators(ACTIVITY)), list(plugins.keys())
+            load.from_yaml(get_indicators(common.ACTIVITY)), list(plugins.keys())
         )
     )
     await asyncio.gather(
@@ -83,21 +84,74 @@ def check_valid_indicator_types(
             continue
 
 
-def get_indicators(activity_directory: str) -> Iterator[str]:
+def merge_activities(indicators: Iterable[dict]) -> List[dict]:
+    """Merge the indicators of several activities, attributing each to every activity it came from.
+
+    An indicator that several activities share word for word is only checked once. One
+    whose name another activity already uses for a different indicator is renamed to
+    "activity:name", so both are checked and reported apart.
+
+    :param indicators: Parsed indicators, each with the activities it came from.
+    :type indicators: Iterable[dict]
+    :return: The indicators, each name once.
+    :rtype: List[dict]
+    """
+    merged = {}
+    for indicator in indicators:
+        activities = indicator.get("activities", [])
+        name = indicator["name"]
+        if name in merged:
+            first = merged[name]
+            if {k: v for k, v in first.items() if k != "activities"} == {
+                k: v for k, v in indicator.items() if k != "activities"
+            }:
+                first["activities"].extend(
+                    a for a in activities if a not in first["activities"]
+                )
+                continue
+            name = "{}:{}".format(":".join(activities), name)
+            logging.warning(
+                "{} is also the name of an indicator in {}, reporting it as {}.".format(
+                    indicator["name"], ", ".join(first["activities"]), name
+                )
+            )
+        # A copy, so the indicators kept in the bundle are left as they were loaded
+        merged[name] = dict(indicator, name=name, activities=list(activities))
+    return list(merged.values())
+
+
+def _activities() -> List[str]:
+    """Return every activity package in the indicators directory."""
+    return sorted(
+        x
+        for x in os.listdir("indicators")
+        if not x.startswith(".") and os.path.isdir(os.path.join("indicators", x))
+    )
+
+
+def get_indicators(activity_directories: List[str]) -> Iterator[str]:
     """Yield paths to indicators.
 
+    :param activity_directories: Activity packages under the indicators directory, or ["all"] for every one.
+    :type activity_directories: List[str]
     :yield: A path to an indicator file.
     :rtype: Iterator[str]
     """
-    if not activity_directory:
-        activity_directory = _extracted_from_get_indicators_4()
-    path = os.path.join("indicators", activity_directory)
-    if not os.path.exists(path):
-        logging.error("The path {} does not exist.".format(path))
+    if not activity_directories:
+        activity_directories = (
+            _extracted_from_get_indicators_4().replace(",", " ").split()
+        )
     try:
-        for f in os.listdir(path):
-            if "README" not in f and f.split(".")[-1] in ("yaml", "yml"):
-                yield os.path.join(path, f)
+        if "all" in activity_directories:
+            activity_directories = _activities()
+        for activity_directory in dict.fromkeys(activity_directories):
+            path = os.path.join("indicators", activity_directory)
+            if not os.path.exists(path):
+                logging.error("The path {} does not exist.".format(path))
+                continue
+            for f in os.listdir(path):
+                if "README" not in f and f.split(".")[-1] in ("yaml", "yml"):
+                    yield os.path.join(path, f)
     except FileNotFoundError:
         logging.error(
             "Could not find an indicators directory. Indicators should be in the same directory as this executable."
@@ -109,7 +163,7 @@ def _extracted_from_get_indicators_4():
     print("Valid Activities")
     print("----------------")
     [print(x) for x in os.listdir("indicators") if x.startswith("AA")]
-    result = input("Please specify an activity: ")
+    result = input("Please specify an activity, several, or all: ")
     print()
 
     return result
@@ -33,7 +33,15 @@ if OS == "Windows":
         "aiomultiprocess",
     ]
 elif OS in ["Linux", "MacOS"]:
-    REQ = ["nuitka", "yara-python", "rich", "pyyaml", "psutil", "aiomultiprocess"]
+    REQ = [
+        "nuitka",
+        "python-evtx",
+        "yara-python",
+        "rich",
+        "pyyaml",
+        "psutil",
+        "aiomultiprocess",
+    ]
 else:
     raise OSError(
         "The operating system {} is not supported by chirp.".format(sys.platform)
@@ -79,5 +87,5 @@ setup(
         "chirp.plugins.network",
     ],
     install_requires=REQ,
-    python_requires=">=3.6",
+    python_requires=">=3.7",
 )
@@ -0,0 +1,22 @@
+"""Reuse regular expression verdicts without keeping the values searched."""
+
+# Standard Python Libraries
+import sys
+
+sys.argv = sys.argv[:1]  # extractors reads its options from the command line on import
+
+# cisagov Libraries
+from chirp.plugins import operators  # noqa: E402
+from chirp.plugins.events import extractors  # noqa: E402
+
+
+def test_verdict_cache_keys_on_digests():
+    """A long value is cached under a fixed size digest, and its verdict is reused."""
+    predicate = operators.compile_predicate("~= Export-PfxCertificate", "event_data")
+    script = "Get-ChildItem Cert:\\ | Export-PfxCertificate " + "x" * 100000
+    extractors._VERDICTS.clear()
+    assert extractors._verdict(predicate, script)
+    assert extractors._verdict(predicate, script)
+    assert not extractors._verdict(predicate, "Get-Process")
+    assert all(len(key[2]) == 16 for key in extractors._VERDICTS)
+    assert len(extractors._VERDICTS) == 2
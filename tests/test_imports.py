@@ -0,0 +1,50 @@
+"""Keep importing CHIRP cheap, leaving the heavy libraries to the plugins that use them."""
+
+# Standard Python Libraries
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED = ("rich", "yara", "Evtx", "aiomultiprocess")
+BUDGET = 1.0
+
+_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import chirp.run
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(" ".join(m for m in {deferred!r} if m in sys.modules))
+"""
+
+
+def _import_run() -> list:
+    """Import chirp.run in a fresh interpreter, returning its time and deferred modules loaded."""
+    script = _SCRIPT.format(deferred=DEFERRED)
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stdout.splitlines()
+    return [float(output[0]), output[1].split()]
+
+
+def test_import_defers_heavy_libraries():
+    """Importing chirp.run loads none of the libraries only a scan needs."""
+    _, loaded = _import_run()
+    assert not loaded, "imported on chirp.run: {}".format(", ".join(loaded))
+
+
+def test_import_within_budget():
+    """Importing chirp.run stays well under a second."""
+    elapsed, _ = _import_run()
+    assert elapsed < BUDGET, "chirp.run took {:.2f}s to import".format(elapsed)
+
+
+def test_import_leaves_argv_alone():
+    """Importing chirp.run does not parse the command line of the process importing it."""
+    script = "import sys; sys.argv = ['tool', '--output']; import chirp.run"
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True)
@@ -0,0 +1,47 @@
+"""Compile indicators once, and warn only about patterns that can backtrack."""
+
+# Standard Python Libraries
+import logging
+
+# cisagov Libraries
+from chirp.plugins import operators
+
+
+def test_bad_condition_logged_once(caplog):
+    """An indicator checked one item at a time compiles, and logs a bad condition, once."""
+    criteria = [("event_data.a", "== 1"), ("event_data.b", "== 2")]
+    with caplog.at_level(logging.ERROR):
+        for _ in range(3):
+            expression = operators.indicator_expression(criteria, "event_data.a and (")
+            assert not expression.evaluate(operators.Record({}), operators.search)
+    assert len([r for r in caplog.records if "Invalid condition" in r.message]) == 1
+    assert operators.indicator_expression(criteria) is operators.indicator_expression(
+        criteria
+    )
+
+
+def test_backtracking_risk_flags_overlapping_repeats():
+    """Repeated groups that can split the same text many ways are flagged."""
+    for pattern in (
+        "(a+)+b",
+        "(a|ab)*c",
+        "(\\d|1)+x",
+        "(?:\\w|_)+$",
+        "(?i)(A|a)+b",
+        "(x?|y)+z",
+        ".*a.*b.*c",
+    ):
+        assert operators.backtracking_risk(pattern), pattern
+
+
+def test_backtracking_risk_leaves_disjoint_alternations():
+    """Repeated groups whose alternatives start on different characters are not flagged."""
+    for pattern in (
+        "(a|b)*",
+        "(\\d|x)+",
+        "(cat|dog)+s",
+        "(?:\\s|,)+",
+        "(\\d{1,3}\\.){3}\\d{1,3}",
+        "Export-PfxCertificate.*-FilePath",
+    ):
+        assert operators.backtracking_risk(pattern) is None, pattern
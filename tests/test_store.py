@@ -0,0 +1,52 @@
+"""Hunt through an event store by reading only the candidates its trigram index finds."""
+
+# cisagov Libraries
+from chirp.plugins.events import store
+
+CHANNEL = "Windows PowerShell"
+SCRIPTS = ["Get-Process", "Export-PfxCertificate -FilePath c:\\t.pfx", "Get-Service"]
+
+
+class _Watched:
+    """A shard connection that keeps the ID of every event row a query returns with its body."""
+
+    def __init__(self, db):
+        self.db = db
+        self.fetched = []
+
+    def execute(self, query, params=()):
+        rows = self.db.execute(query, params).fetchall()
+        if "body" in query:
+            self.fetched.extend(row[0] for row in rows)
+        return iter(rows)
+
+
+def _shard(tmp_path, copies=1):
+    path = str(tmp_path / "shard.db")
+    with store.Shard(path) as shard:
+        for _ in range(copies):
+            for script in SCRIPTS:
+                event = {"event": {"event_data": {"script_block_text": script}}}
+                shard.add(CHANNEL, "4104", "2021-01-05 13:30:00.000000", event)
+    return store.connect(path)
+
+
+def test_read_fetches_only_candidates(tmp_path):
+    """Events the index rules out are never fetched from the shard."""
+    db = _shard(tmp_path)
+    criteria = [("event.event_data.script_block_text", "~= Export-PfxCertificate")]
+    ids = store.candidates(db, criteria)
+    assert ids == {2}
+    watched = _Watched(db)
+    assert [event for event, _ in store.read(watched, CHANNEL, "4104", ids)] == [2]
+    assert watched.fetched == [2]
+
+
+def test_read_batches_candidates(tmp_path):
+    """More candidates than one query can bind are read in batches, in order."""
+    db = _shard(tmp_path, copies=store._BATCH)
+    ids = set(range(1, 3 * store._BATCH + 1, 3))
+    watched = _Watched(db)
+    read = [event for event, _ in store.read(watched, CHANNEL, None, ids)]
+    assert read == sorted(ids)
+    assert watched.fetched == sorted(ids)